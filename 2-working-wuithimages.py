@@ -1,14 +1,23 @@
-from PIL import Image, ImageEnhance
+from image_pipeline import Adjustments, ImagePipeline
 
-# Open and resize an image
-image = Image.open('basic_shapes.png')
-resized_image = image.resize((800, 600))
+# Brightness and contrast fused into one lookup table: a single pass over
+# the pixels instead of one pass and one intermediate image per enhancer
+ENHANCEMENTS = (Adjustments()
+                .brightness(1.5)   # Increase brightness by 50%
+                .contrast(1.2))    # Increase contrast by 20%
 
-# Apply filters
-enhancer = ImageEnhance.Brightness(resized_image)
-brightened = enhancer.enhance(1.5)  # Increase brightness by 50%
+def enhance_pipeline(name_format='enhanced.jpg', size=(800, 600)):
+    pipeline = ImagePipeline()
 
-enhancer = ImageEnhance.Contrast(brightened)
-final_image = enhancer.enhance(1.2)  # Increase contrast by 20%
+    # The lookup pass runs before or after the resize, whichever touches
+    # fewer pixels for each source
+    final_image = pipeline.source.adjust_resize(ENHANCEMENTS, size)
 
-final_image.save('enhanced.jpg')
\ No newline at end of file
+    final_image.save(name_format)
+    return pipeline
+
+if __name__ == "__main__":
+    enhance_pipeline().run_files(['basic_shapes.png'], workers=1)
+
+    # A whole folder in parallel:
+    # enhance_pipeline('{stem}_enhanced.jpg').run('photos', 'enhanced', pattern='*.jpg')
@@ -1,25 +1,89 @@
-from PIL import Image, ImageDraw, ImageFont
+import csv
+import multiprocessing
+import os
+import time
+from PIL import Image, ImageDraw
+from text_render import load_font
 
-def create_text_overlay(text, font_size=60):
-    # Create image
-    img = Image.new('RGB', (800, 400), 'white')
-    draw = ImageDraw.Draw(img)
-
-    # Load font (use a system font or download custom ones)
-    font = ImageFont.truetype("arial.ttf", font_size)
+CANVAS_SIZE = (800, 400)
 
+def draw_centered_text(draw, text, font, size=CANVAS_SIZE):
     # Calculate text size and position for center alignment
     text_bbox = draw.textbbox((0, 0), text, font=font)
     text_width = text_bbox[2] - text_bbox[0]
     text_height = text_bbox[3] - text_bbox[1]
 
-    x = (800 - text_width) // 2
-    y = (400 - text_height) // 2
+    x = (size[0] - text_width) // 2
+    y = (size[1] - text_height) // 2
 
     # Draw text
     draw.text((x, y), text, font=font, fill='black')
+
+def create_text_overlay(text, font_size=60):
+    # Create image
+    img = Image.new('RGB', CANVAS_SIZE, 'white')
+    draw = ImageDraw.Draw(img)
+
+    # Load font (cached per size; falls back to Pillow's default font)
+    font = load_font("arial.ttf", font_size)
+
+    draw_centered_text(draw, text, font)
     return img
 
-# Example usage
-text_image = create_text_overlay("Hello World!")
-text_image.save('text_overlay.png')
\ No newline at end of file
+# State of each batch worker: the font and one canvas reused for every card
+_canvas = None
+_draw = None
+_font = None
+
+def _init_worker(font_size):
+    global _canvas, _draw, _font
+    _canvas = Image.new('RGB', CANVAS_SIZE, 'white')
+    _draw = ImageDraw.Draw(_canvas)
+    _font = load_font("arial.ttf", font_size)
+
+def _render_overlay(job):
+    text, path = job
+    # Reset the template canvas instead of allocating a new one
+    _draw.rectangle([(0, 0), CANVAS_SIZE], fill='white')
+    draw_centered_text(_draw, text, _font)
+    _canvas.save(path)
+    return path
+
+def read_captions(csv_path, column=0):
+    # Stream caption texts from one column of a CSV file
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) > column and row[column].strip():
+                yield row[column]
+
+def create_text_overlays(texts, output_dir, font_size=60, workers=None,
+                         name_format='overlay_{:05d}.png', chunksize=64):
+    # Render many overlay cards with a process pool, writing each image to
+    # disk as soon as it is finished. Returns the throughput in images/sec.
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = ((text, os.path.join(output_dir, name_format.format(i)))
+            for i, text in enumerate(texts))
+
+    start = time.perf_counter()
+    count = 0
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(font_size,))
+    try:
+        for _ in pool.imap_unordered(_render_overlay, jobs, chunksize=chunksize):
+            count += 1
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed else 0.0
+    print(f"Rendered {count} overlays in {elapsed:.2f}s ({rate:.1f} images/sec)")
+    return rate
+
+if __name__ == "__main__":
+    # Example usage
+    text_image = create_text_overlay("Hello World!")
+    text_image.save('text_overlay.png')
+
+    # Batch usage: one card per caption in a CSV file
+    # create_text_overlays(read_captions('captions.csv'), 'overlays')
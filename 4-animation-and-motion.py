@@ -1,23 +1,22 @@
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
-import moviepy.config as mp_config
-
-# Set the path to the ImageMagick binary
-mp_config.change_settings({"IMAGEMAGICK_BINARY": "C:\\Program Files\\ImageMagick-7.1.1-Q16\\magick.exe"})
+from compositing import LayerStack, static_layer
+from text_render import text_clip
 
 def create_animated_text(text, duration=5):
-    # Create text clip
-    txt_clip = TextClip(text, fontsize=70, color='white')
+    # Create text clip (rendered in-process with Pillow, no ImageMagick)
+    txt_clip = text_clip(text, fontsize=70, color='white')
     txt_clip = txt_clip.set_position('center')
 
-    # Add animation
+    # Add animation: the text is rasterized once and only its
+    # opacity changes from frame to frame
     txt_clip = txt_clip.set_duration(duration)
-    txt_clip = txt_clip.fadein(1).fadeout(1)
+    txt_layer = static_layer(txt_clip, fadein=1, fadeout=1)
 
     # Create final video
-    final_clip = CompositeVideoClip([txt_clip],
-                                   size=(1920, 1080))
+    final_clip = LayerStack([txt_layer],
+                            size=(1920, 1080)).to_clip(duration)
     final_clip.write_videofile("animated_text.mp4",
                              fps=24)
 
-# Example usage
-create_animated_text("Welcome to My Channel!")
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    create_animated_text("Welcome to My Channel!")
\ No newline at end of file
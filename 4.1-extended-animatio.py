@@ -1,121 +1,207 @@
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip, concatenate_videoclips, AudioFileClip, ImageClip, vfx
-import moviepy.config as mp_config
-from moviepy.editor import *
-from moviepy.editor import concatenate_videoclips, vfx
+from moviepy.editor import AudioClip, ImageClip, VideoFileClip, concatenate_videoclips
 import cv2
+import os
+import tempfile
+from collections import Counter
 import numpy as np
-# Set the path to the ImageMagick binary
-mp_config.change_settings({"IMAGEMAGICK_BINARY": "C:\\Program Files\\ImageMagick-7.1.1-Q16\\magick.exe"})
+from compositing import LayerStack, Overlay, Timeline, static_layer
+from instrumentation import traced
+from text_render import text_clip
+from video_tools import (concat_by_copy, draft_length, draft_size, load_image,
+                         load_video, mux_audio, parse_rate, probe_streams,
+                         probe_video_span,
+                         write_videofile)
 
 def create_animated_text(text, duration=5):
-    # Create text clip
-    txt_clip = TextClip(text, fontsize=70, color='white')
+    # Create text clip (rendered in-process with Pillow, no ImageMagick)
+    txt_clip = text_clip(text, fontsize=draft_length(70), color='white')
     txt_clip = txt_clip.set_position('center')
 
-    # Add animation
+    # Add animation: the text is rasterized once and only its
+    # opacity changes from frame to frame
     txt_clip = txt_clip.set_duration(duration)
-    txt_clip = txt_clip.fadein(1).fadeout(1)
+    txt_layer = static_layer(txt_clip, fadein=1, fadeout=1)
 
     # Create final video
-    final_clip = CompositeVideoClip([txt_clip],
-                                   size=(1920, 1080))
-    final_clip.write_videofile("animated_text.mp4",
+    final_clip = LayerStack([txt_layer],
+                            size=draft_size((1920, 1080))).to_clip(duration)
+    write_videofile(final_clip, "animated_text.mp4",
                              fps=24)
 
 def add_audio_to_video(video_path, audio_path, output_path):
-    video = VideoFileClip(video_path)
-    audio = AudioFileClip(audio_path)
-    video_with_audio = video.set_audio(audio)
-    video_with_audio.write_videofile(output_path, fps=24)
+    # The video stream is copied, only the audio is (at most) encoded
+    mux_audio(video_path, audio_path, output_path)
+
+# Encoders for the stream codecs that join_videos can conform inputs to
+VIDEO_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265', 'mpeg4': 'mpeg4',
+                  'vp8': 'libvpx', 'vp9': 'libvpx-vp9'}
+AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus',
+                  'vorbis': 'libvorbis'}
+X264_PROFILES = ('baseline', 'main', 'high')
+# Containers whose video time base can be set with -video_track_timescale
+TIMESCALE_CONTAINERS = ('.mp4', '.m4v', '.mov')
+
+def silence(duration, nchannels=2):
+    return AudioClip(lambda t: np.zeros((len(t), nchannels)) if np.ndim(t)
+                     else np.zeros(nchannels), duration=duration)
+
+def conform_video(path, output_path, signature):
+    # Re-encode one input with the stream parameters of the others. Its
+    # audio may run past the last frame; the part ends with the video so
+    # no frame is added at the seam.
+    clip = VideoFileClip(path)
+    start, end = probe_video_span(path)
+    clip = clip.subclip(0, min(clip.duration, end - start))
+    size = (signature.width, signature.height)
+    if tuple(clip.size) != size:
+        clip = clip.resize(min(size[0]/clip.w, size[1]/clip.h))
+        clip = clip.on_color(size=size, color=(0, 0, 0), pos='center')
+    has_audio = signature.audio_codec is not None
+    if has_audio and clip.audio is None:
+        clip = clip.set_audio(silence(
+            clip.duration, 1 if signature.channels == 'mono' else 2))
+    params = ['-pix_fmt', signature.pix_fmt]
+    profile = (signature.profile or '').lower().replace('constrained ', '')
+    if signature.video_codec == 'h264' and profile in X264_PROFILES:
+        params += ['-profile:v', profile]
+    ext = os.path.splitext(output_path)[1].lower()
+    if signature.time_base and ext in TIMESCALE_CONTAINERS:
+        params += ['-video_track_timescale', str(int(parse_rate(signature.time_base)))]
+    write_videofile(clip, output_path, fps=float(parse_rate(signature.fps)),
+                    codec=VIDEO_ENCODERS[signature.video_codec],
+                    audio=has_audio,
+                    audio_codec=AUDIO_ENCODERS.get(signature.audio_codec),
+                    audio_fps=int(signature.sample_rate or 44100),
+                    ffmpeg_params=params, draft=False)
 
 def join_videos(video_paths, output_path):
-    clips = [VideoFileClip(path) for path in video_paths]
-    final_clip = concatenate_videoclips(clips, method='compose')
-    final_clip.write_videofile(output_path, fps=24)
+    # Inputs that share codec, resolution and fps are joined by stream
+    # copy; only the odd ones out are decoded and re-encoded to match
+    signatures = [probe_streams(path) for path in video_paths]
+    reference = Counter(signatures).most_common(1)[0][0]
+    if (reference.video_codec not in VIDEO_ENCODERS or
+            (reference.audio_codec or 'aac') not in AUDIO_ENCODERS):
+        clips = [load_video(path) for path in video_paths]
+        final_clip = concatenate_videoclips(clips, method='compose')
+        write_videofile(final_clip, output_path, fps=24)
+        return
+
+    ext = os.path.splitext(output_path)[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        parts = []
+        for i, (path, signature) in enumerate(zip(video_paths, signatures)):
+            if signature != reference:
+                part = os.path.join(tmp, f'part_{i:04d}{ext}')
+                conform_video(path, part, reference)
+                path = part
+            parts.append(path)
+        concat_by_copy(parts, output_path)
 
 def apply_transition_between_videos(video_paths, output_path, transitions):
-    clips = [VideoFileClip(path) for path in video_paths]
-    transition_duration = 1
-
-    def crossfade(clip1, clip2):
-        return CompositeVideoClip([
-            clip1.crossfadeout(transition_duration),
-            clip2.crossfadein(transition_duration).set_start(clip1.duration - transition_duration)
-        ])
-
-    def blur_transition(clip1, clip2, transition_duration):
-        # Apply Gaussian blur to both clips
-        blurred_clip1 = clip1.fx(vfx.gaussian_blur, radius=5)  # Adjust the radius as needed
-        blurred_clip2 = clip2.fx(vfx.gaussian_blur, radius=5)  # Adjust the radius as needed
-        
-        # Concatenate the clips with a smooth transition
-        return concatenate_videoclips([blurred_clip1, blurred_clip2], method='compose')
-
-
-    final_clip = clips[0]
-    for i, next_clip in enumerate(clips[1:]):
-        if transitions[i] == "crossfade":
-            final_clip = crossfade(final_clip, next_clip)
-        elif transitions[i] == "blur":
-            final_clip = blur_transition(final_clip, next_clip)
-
-    final_clip.write_videofile(output_path, fps=24)
-
-def Zoom(clip,mode='in',position='center',speed=1):
+    clips = [load_video(path) for path in video_paths]
+    # One flat timeline: each frame only touches the clips active at t
+    final_clip = Timeline(clips, transitions, transition_duration=1).to_clip()
+    write_videofile(final_clip, output_path, fps=24)
+
+# Where the zoom window sits inside the frame, as a fraction of the
+# space left over around it (0 = left/top edge, 1 = right/bottom edge)
+ZOOM_ANCHORS = {'center': (0.5, 0.5),
+                'left': (0, 0.5),
+                'right': (1, 0.5),
+                'top': (0.5, 0),
+                'topleft': (0, 0),
+                'topright': (1, 0),
+                'bottom': (0.5, 1),
+                'bottomleft': (0, 1),
+                'bottomright': (1, 1)}
+
+# Direction the picture moves in for each pan, as the (x, y) start and end
+# anchors of the crop window (the window moves the opposite way)
+PAN_DIRECTIONS = {'right': ((1, 0.5), (0, 0.5)),
+                  'left': ((0, 0.5), (1, 0.5)),
+                  'down': ((0.5, 1), (0.5, 0)),
+                  'up': ((0.5, 0), (0.5, 1))}
+
+def crop_schedule(w, h, zooms, anchors_x, anchors_y):
+    # Crop window (x, y, width, height) of every frame, computed once
+    zooms = np.asarray(zooms, dtype=float)
+    crop_w = np.clip(np.rint(w/zooms), 1, w).astype(int)
+    crop_h = np.clip(np.rint(h/zooms), 1, h).astype(int)
+    x = np.rint((w-crop_w)*np.asarray(anchors_x)).astype(int)
+    y = np.rint((h-crop_h)*np.asarray(anchors_y)).astype(int)
+    return np.stack([x, y, crop_w, crop_h], axis=1)
+
+def apply_crop_schedule(clip, zooms, anchors_x, anchors_y):
     fps = clip.fps
-    duration = clip.duration
-    total_frames = int(duration*fps)
+    # A still image is rendered once instead of asking the clip every
+    # frame; through get_frame, as .img misses earlier transforms
+    still = clip.get_frame(0) if isinstance(clip, ImageClip) else None
+    # Crop windows fitted to the frames actually cropped
+    w,h = still.shape[1::-1] if still is not None else clip.size
+    schedule = crop_schedule(w,h,zooms,anchors_x,anchors_y)
+    last = len(schedule)-1
+    @traced('crop_schedule.frame', 'frame')
     def main(getframe,t):
-        frame = getframe(t)
+        frame = still if still is not None else getframe(t)
         h,w = frame.shape[:2]
-        i = t*fps
-        if mode == 'out':
-            i = total_frames-i
-        zoom = 1+(i*((0.1*speed)/total_frames))
-        positions = {'center':[(w-(w*zoom))/2,(h-(h*zoom))/2],
-                     'left':[0,(h-(h*zoom))/2],
-                     'right':[(w-(w*zoom)),(h-(h*zoom))/2],
-                     'top':[(w-(w*zoom))/2,0],
-                     'topleft':[0,0],
-                     'topright':[(w-(w*zoom)),0],
-                     'bottom':[(w-(w*zoom))/2,(h-(h*zoom))],
-                     'bottomleft':[0,(h-(h*zoom))],
-                     'bottomright':[(w-(w*zoom)),(h-(h*zoom))]}
-        tx,ty = positions[position]
-        M = np.array([[zoom,0,tx], [0,zoom,ty]])
-        frame = cv2.warpAffine(frame,M,(w,h))
-        return frame
+        x,y,crop_w,crop_h = schedule[min(int(round(t*fps)),last)]
+        # Only the visible region is resized back up to the frame size
+        return cv2.resize(frame[y:y+crop_h,x:x+crop_w],(w,h),
+                          interpolation=cv2.INTER_LINEAR)
     return clip.fl(main)
-def create_video_from_image_with_effects(image_path, output_path, effect):
-    #img_clip = ImageClip(image_path, duration=10)
-    clip = ImageClip(image_path).set_fps(30).set_duration(10)
-    clip = Zoom(clip,mode='in',position='center',speed=1) #zoom function above
 
-    clip.write_videofile(output_path,preset='superfast')
+def _frame_steps(clip):
+    total_frames = int(clip.duration*clip.fps)
+    return total_frames, np.arange(total_frames+1)
 
-    # if effect == "zoom_in":
-        #img_clip = img_clip.set_position('center')
-        # final_clip = img_clip.fx(vfx.resize, lambda t: (1 + 0.01 * t / 10, 1 + 0.01 * t / 10)) 
-    # elif effect == "pan_clip_right":
-    #     final_clip = img_clip.set_position(lambda t: (100 + 30 * t, 'center'))
-    # elif effect == "zoom_and_pan":
-    #     zoom_clip = img_clip.fx(vfx.resize, lambda t: 1 + 0.02 * t)
-    #     final_clip = zoom_clip.set_position(lambda t: (100 + 30 * t, 'center'))
-    # else:
-    #     final_clip = img_clip  # Default effect (no transformation)
+def Zoom(clip,mode='in',position='center',speed=1):
+    total_frames, i = _frame_steps(clip)
+    if mode == 'out':
+        i = total_frames-i
+    zooms = 1+(i*((0.1*speed)/total_frames))
+    ax,ay = ZOOM_ANCHORS[position]
+    return apply_crop_schedule(clip,zooms,ax,ay)
+
+def Pan(clip,direction='right',zoom=1.1,speed=1):
+    # Slide a fixed-size window across the picture; zoom sets the margin
+    total_frames, i = _frame_steps(clip)
+    progress = np.clip(i*speed/total_frames,0,1)
+    (x0,y0),(x1,y1) = PAN_DIRECTIONS[direction]
+    return apply_crop_schedule(clip,np.full(len(i),zoom),
+                               x0+(x1-x0)*progress,y0+(y1-y0)*progress)
+
+def ZoomAndPan(clip,direction='right',speed=1):
+    total_frames, i = _frame_steps(clip)
+    progress = np.clip(i*speed/total_frames,0,1)
+    zooms = 1+0.2*progress
+    (x0,y0),(x1,y1) = PAN_DIRECTIONS[direction]
+    return apply_crop_schedule(clip,zooms,x0+(x1-x0)*progress,y0+(y1-y0)*progress)
+
+def create_video_from_image_with_effects(image_path, output_path, effect):
+    clip = load_image(image_path).set_fps(30).set_duration(10)
+    if effect == "zoom_in":
+        clip = Zoom(clip,mode='in',position='center',speed=1)
+    elif effect == "pan_clip_right":
+        clip = Pan(clip,direction='right')
+    elif effect == "zoom_and_pan":
+        clip = ZoomAndPan(clip,direction='right')
+    # Any other effect keeps the still image
 
-    #final_clip.write_videofile(output_path, fps=24)
+    write_videofile(clip, output_path,preset='superfast')
 
 def overlay_videos_with_transparency(background_video_path, overlay_video_path, output_path, transparency):
-    background_clip = VideoFileClip(background_video_path)
-    overlay_clip = VideoFileClip(overlay_video_path).set_opacity(transparency)
-    final_clip = CompositeVideoClip([background_clip, overlay_clip.set_position('center')])
-    final_clip.write_videofile(output_path, fps=24)
-
-# Example usage
-# create_animated_text("Welcome to My Channel!")
-# add_audio_to_video("animated_text.mp4", "output.mp3", "final_with_audio.mp4")
-# join_videos(["animated_text.mp4", "final_with_audio.mp4"], "joined_videos.mp4")
-# apply_transition_between_videos(["final_with_audio.mp4", "animated_text.mp4", "joined_videos.mp4"], "videos_with_transitions.mp4", ["crossfade", "crossfade"])
-create_video_from_image_with_effects("extended_pil_practice.png", "image_to_video.mp4", "zoom_in")
-overlay_videos_with_transparency("image_to_video.mp4", "final_with_audio.mp4", "video_with_overlay.mp4", 0.5)
+    background_clip = load_video(background_video_path)
+    overlay_clip = load_video(overlay_video_path)
+    # Fixed-point blend into a reused frame instead of a float composite
+    final_clip = Overlay(background_clip, overlay_clip, opacity=transparency,
+                         pos='center').to_clip()
+    write_videofile(final_clip, output_path, fps=24)
+
+if __name__ == "__main__":
+    # Example usage
+    # create_animated_text("Welcome to My Channel!")
+    # add_audio_to_video("animated_text.mp4", "output.mp3", "final_with_audio.mp4")
+    # join_videos(["animated_text.mp4", "final_with_audio.mp4"], "joined_videos.mp4")
+    # apply_transition_between_videos(["final_with_audio.mp4", "animated_text.mp4", "joined_videos.mp4"], "videos_with_transitions.mp4", ["crossfade", "crossfade"])
+    create_video_from_image_with_effects("extended_pil_practice.png", "image_to_video.mp4", "zoom_in")
+    overlay_videos_with_transparency("image_to_video.mp4", "final_with_audio.mp4", "video_with_overlay.mp4", 0.5)
@@ -1,17 +1,138 @@
+import multiprocessing
+import os
+from functools import lru_cache
+from io import BytesIO
+from string import Template
+from xml.sax.saxutils import escape
+
+import numpy as np
 import svgwrite
+from PIL import Image
+from render_cache import ContentCache, content_key
+
+try:
+    import cairosvg  # also needs the Cairo library
+except (ImportError, OSError):
+    cairosvg = None
+
+LOGO_CACHE_DIR = '.logo_cache'
+
+
+class LogoTemplate:
+    """The logo's SVG, built once with svgwrite and filled in by substitution.
+
+    Parameters are escaped for XML before they are substituted, so any
+    text can be used. The drawing is 200x200 user units and is scaled to
+    size pixels through its viewBox.
+    """
+
+    def __init__(self):
+        dwg = svgwrite.Drawing(size=('${size}', '${size}'), viewBox='0 0 200 200',
+                               debug=False)
+
+        # Add background circle
+        dwg.add(dwg.circle(center=(100, 100), r=80,
+                fill='${color}'))
+
+        # Add text
+        dwg.add(dwg.text('${text}', insert=(100, 110), text_anchor='middle',
+                fill='${text_color}', font_size=40))
+
+        self.template = Template(dwg.tostring())
+
+    def render(self, text='LOGO', color='#2196F3', text_color='white', size=200):
+        return self.template.substitute(
+            text=escape(str(text)), size=int(size),
+            color=escape(color, {'"': '&quot;'}),
+            text_color=escape(text_color, {'"': '&quot;'}))
+
+
+logo_template = LogoTemplate()
+
+
+def rasterize(svg):
+    """Render SVG markup to PNG bytes."""
+    if cairosvg is None:
+        raise RuntimeError("Rasterizing logos needs cairosvg and the Cairo library")
+    return cairosvg.svg2png(bytestring=svg.encode('utf-8'))
+
+
+def cached_png(cache, svg):
+    """PNG bytes of svg, from the cache or rasterized and stored on a miss."""
+    key = content_key(svg)
+    cached = cache.open(key, '.png')
+    if cached is None:
+        png = rasterize(svg)
+        cache.put(key, png, '.png')
+        return png
+    with cached:
+        return cached.read()
+
+
+@lru_cache(maxsize=64)
+def _logo_rgba(cache_dir, svg):
+    with Image.open(BytesIO(cached_png(ContentCache(cache_dir), svg))) as img:
+        rgba = np.array(img.convert('RGBA'))
+    rgba.flags.writeable = False
+    return rgba
+
+
+def logo_rgba(cache_dir=LOGO_CACHE_DIR, **params):
+    """The logo as a read-only RGBA array, for use as a video overlay."""
+    return _logo_rgba(cache_dir, logo_template.render(**params))
+
+
+def create_simple_logo(filename='logo.svg', **params):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(logo_template.render(**params))
+
+
+# Where the worker processes of create_logos write and cache
+_output_dir = None
+_cache = None
+
+
+def _init_worker(output_dir, cache_dir):
+    global _output_dir, _cache
+    _output_dir = output_dir
+    _cache = ContentCache(cache_dir) if cache_dir else None
+
+
+def _create_logo(variant):
+    params = dict(variant)
+    name = params.pop('name', None)
+    svg = logo_template.render(**params)
+    name = name or content_key(svg)[:16]
+    if _cache is None:
+        path = os.path.join(_output_dir, name + '.svg')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(svg)
+    else:
+        path = os.path.join(_output_dir, name + '.png')
+        with open(path, 'wb') as f:
+            f.write(cached_png(_cache, svg))
+    return path
 
-def create_simple_logo():
-    # Create new SVG drawing
-    dwg = svgwrite.Drawing('logo.svg', size=(200, 200))
 
-    # Add background circle
-    dwg.add(dwg.circle(center=(100, 100), r=80,
-            fill='#2196F3'))
+def create_logos(variants, output_dir='logos', raster=True, cache_dir=LOGO_CACHE_DIR,
+                 workers=None, chunksize=16):
+    """Write one logo per variant, in parallel.
 
-    # Add text
-    dwg.add(dwg.text('LOGO', insert=(50, 110),
-            fill='white', font_size=40))
+    Each variant is a dict of LogoTemplate.render parameters plus an
+    optional 'name' for the output file (by default a hash of the logo).
+    With raster, PNGs are written and every distinct logo is rasterized
+    only once, then served from the content-addressed cache in
+    cache_dir; otherwise SVG files are written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(output_dir, cache_dir if raster else None))
+    try:
+        return pool.map(_create_logo, variants, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
 
-    dwg.save()
 
-create_simple_logo()
\ No newline at end of file
+if __name__ == "__main__":
+    create_simple_logo()
@@ -1,17 +1,84 @@
-from moviepy.editor import ImageClip, concatenate_videoclips
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-def create_slideshow(image_files, duration_per_image=3):
-    # Create clips from images
-    clips = [ImageClip(img).set_duration(duration_per_image)
-             for img in image_files]
+import numpy as np
+from moviepy.editor import VideoClip
+from PIL import Image
+from video_tools import draft_size, write_videofile
 
-    # Concatenate clips
-    final_clip = concatenate_videoclips(clips,
-                                      method="compose")
+
+class SlideLoader:
+    """Decodes slides just before they are shown, on a background thread.
+
+    Every image is decoded once, shrunk to fit the output size and centered
+    on a black frame, so all frames already have the output size and need
+    no compositing. JPEGs are decoded at a reduced scale when they are much
+    larger than the output. Only the requested slide and the next few are
+    held in memory, however many images there are.
+    """
+
+    def __init__(self, image_files, size, window=3):
+        self.image_files = list(image_files)
+        self.size = size
+        self.window = window
+        self._pid = None
+
+    def _start(self):
+        # Threads do not survive fork, so each process gets its own
+        # prefetch thread the first time it asks for a slide
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = {}
+
+    def load(self, index):
+        width, height = self.size
+        with Image.open(self.image_files[index]) as img:
+            img.draft('RGB', self.size)
+            img = img.convert('RGB')
+            img.thumbnail(self.size, Image.LANCZOS)
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        x, y = (width - img.width) // 2, (height - img.height) // 2
+        frame[y:y + img.height, x:x + img.width] = np.asarray(img)
+        return frame
+
+    def get(self, index):
+        """Frame of slide index; queues the following slides for decoding."""
+        if self._pid != os.getpid():
+            self._start()
+        for stale in [i for i in self._pending if i < index]:
+            del self._pending[stale]
+        for i in range(index, min(index + self.window, len(self.image_files))):
+            if i not in self._pending:
+                self._pending[i] = self._executor.submit(self.load, i)
+        return self._pending[index].result()
+
+
+def image_size(path):
+    # Reads only the header
+    with Image.open(path) as img:
+        return img.size
+
+
+def create_slideshow(image_files, duration_per_image=3, output_path="slideshow.mp4",
+                     size=None, fps=24, window=3):
+    # Without a size, use the largest width and height, as
+    # concatenate_videoclips(method="compose") would
+    if size is None:
+        sizes = [image_size(path) for path in image_files]
+        size = (max(w for w, _ in sizes), max(h for _, h in sizes))
+    size = draft_size(size)
+
+    # Slides are decoded shortly before they are shown
+    loader = SlideLoader(image_files, size, window)
+    last = len(image_files) - 1
+    final_clip = VideoClip(
+        lambda t: loader.get(min(int(t // duration_per_image), last)),
+        duration=len(image_files) * duration_per_image)
 
     # Write final video
-    final_clip.write_videofile("slideshow.mp4", fps=24)
+    write_videofile(final_clip, output_path, fps=fps)
 
-# Example usage
-images = ['basic_shapes.png', 'text_overlay.png', 'enhanced.jpg']
-create_slideshow(images)
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    images = ['basic_shapes.png', 'text_overlay.png', 'enhanced.jpg']
+    create_slideshow(images)
@@ -0,0 +1,471 @@
+"""Benchmarks for the rendering and audio paths.
+
+Every benchmark builds its own synthetic input from a fixed seed in a
+scratch directory, so runs are comparable across machines and commits.
+Results are printed as JSON: the best and median wall time over the
+repeats, throughput in the benchmark's unit, and the peak Python memory
+(from tracemalloc, which includes NumPy buffers but not child processes)
+of one further run.
+
+Benchmarks are split into two groups:
+
+    pure      in-process Python/NumPy work
+    external  stages that run ffmpeg or fluidsynth
+
+Usage:
+
+    python benchmark.py                      # run everything, print JSON
+    python benchmark.py --group pure -o results.json
+    python benchmark.py --update-baseline    # store results as the baseline
+    python benchmark.py --baseline benchmark_baseline.json
+
+When a baseline exists, every benchmark found in it is compared and the
+exit status is 1 if any is slower (or uses more memory) than the baseline
+by more than the tolerance.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from scripts import load_script
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+SEED = 1234
+FRAME_SIZE = (640, 360)
+
+# name -> (group, unit, function building the timed callable)
+BENCHMARKS = {}
+
+
+class Skip(Exception):
+    """Raised by a benchmark whose tools are not available here."""
+
+
+def benchmark(name, group, unit):
+    """Register a benchmark.
+
+    The decorated function gets a scratch directory, prepares its inputs
+    and returns a callable that does the timed work and returns how many
+    units it processed.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (group, unit, setup)
+        return setup
+    return register
+
+
+def synthetic_image(path, size=(1280, 720), seed=SEED):
+    """Gradient with shapes and noise: compresses like a photo, not like a flat fill."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    x = np.linspace(0, 255, w)[None, :, None]
+    y = np.linspace(0, 255, h)[:, None, None]
+    base = np.concatenate([x + 0*y, y + 0*x, (x + y) / 2], axis=2)
+    noise = rng.normal(0, 12, (h, w, 3))
+    img = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, w), rng.integers(0, h)
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        draw.ellipse([x0, y0, x0 + w // 8, y0 + h // 8], fill=color)
+    img.save(path)
+    return path
+
+
+def synthetic_video(path, seconds=2, fps=24, size=FRAME_SIZE, seed=SEED):
+    """A short moving test pattern with a tone, encoded with ffmpeg."""
+    from moviepy.editor import AudioClip, VideoClip
+    from video_tools import write_videofile
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    clip = VideoClip(lambda t: np.roll(frame, int(t * 100), axis=1), duration=seconds)
+    tone = AudioClip(lambda t: np.stack([np.sin(440 * 2 * np.pi * np.asarray(t))] * 2, axis=-1),
+                     duration=seconds, fps=44100)
+    write_videofile(clip.set_audio(tone), path, fps=fps, logger=None, workers=1)
+    return path
+
+
+def need_binary(name):
+    if name == 'ffmpeg':
+        # The binary moviepy runs, which pydub also falls back to
+        from moviepy.config import get_setting
+        name = get_setting('FFMPEG_BINARY')
+    if shutil.which(name) is None:
+        raise Skip(f"{name} not found")
+
+
+def frame_loop(clip, frames, fps=24):
+    def run():
+        for i in range(frames):
+            clip.get_frame(i / fps)
+        return frames
+    return run
+
+
+# Pure Python/NumPy stages
+
+@benchmark('zoom_frames', 'pure', 'frames')
+def bench_zoom(tmp):
+    from moviepy.editor import ImageClip
+    animation = load_script('4.1-extended-animatio.py')
+    image = synthetic_image(os.path.join(tmp, 'still.png'))
+    clip = animation.Zoom(ImageClip(image).set_fps(24).set_duration(2))
+    return frame_loop(clip, 48)
+
+
+@benchmark('overlay_frames', 'pure', 'frames')
+def bench_overlay(tmp):
+    from moviepy.editor import VideoClip
+    from compositing import Overlay
+    rng = np.random.default_rng(SEED)
+    background = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    overlay = rng.integers(0, 256, (360, 640, 3), dtype=np.uint8)
+    clip = Overlay(VideoClip(lambda t: background, duration=2),
+                   VideoClip(lambda t: overlay, duration=2), 0.5).to_clip()
+    return frame_loop(clip, 48)
+
+
+@benchmark('transition_frames', 'pure', 'frames')
+def bench_transition(tmp):
+    from moviepy.editor import VideoClip
+    from compositing import Timeline
+    rng = np.random.default_rng(SEED)
+    frames = [rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8) for _ in range(2)]
+    clips = [VideoClip(lambda t, f=f: f, duration=2).set_fps(24) for f in frames]
+    clip = Timeline(clips, ['crossfade'], transition_duration=1).to_clip()
+
+    def run():
+        # Frames inside the one-second crossfade
+        for i in range(24):
+            clip.get_frame(1 + i / 24)
+        return 24
+    return run
+
+
+@benchmark('animated_text_frames', 'pure', 'frames')
+def bench_animated_text(tmp):
+    from compositing import LayerStack, static_layer
+    from text_render import text_clip
+    layer = text_clip("Welcome to My Channel!", fontsize=70).set_position('center')
+    layer = static_layer(layer.set_duration(5), fadein=1, fadeout=1)
+    clip = LayerStack([layer], size=(1920, 1080)).to_clip(5)
+    return frame_loop(clip, 120)
+
+
+@benchmark('text_overlay_images', 'pure', 'images')
+def bench_text_overlays(tmp):
+    typography = load_script('3-test-typography.py')
+    texts = [f"Caption number {i}" for i in range(200)]
+    output_dir = os.path.join(tmp, 'overlays')
+
+    def run():
+        typography.create_text_overlays(texts, output_dir, workers=1)
+        return len(texts)
+    return run
+
+
+@benchmark('pil_practice_pipeline', 'pure', 'images')
+def bench_practice_pipeline(tmp):
+    morpil = load_script('1.1-morpil.py')
+    pipeline = morpil.practice_pipeline()
+    img = morpil.draw_practice_image()
+
+    def run():
+        for i in range(10):
+            pipeline.run_image(img, f'img{i}', tmp)
+        return 10
+    return run
+
+
+@benchmark('pil_enhance_pipeline', 'pure', 'images')
+def bench_enhance_pipeline(tmp):
+    enhance = load_script('2-working-wuithimages.py')
+    paths = [synthetic_image(os.path.join(tmp, f'src{i}.png'), seed=SEED + i)
+             for i in range(10)]
+    pipeline = enhance.enhance_pipeline('{stem}_enhanced.jpg')
+    output_dir = os.path.join(tmp, 'enhanced')
+
+    def run():
+        return pipeline.run_files(paths, output_dir, workers=1)
+    return run
+
+
+@benchmark('note_generation', 'pure', 'bars')
+def bench_note_generation(tmp):
+    from music import SongStream
+
+    def run():
+        stream = SongStream('sad', seed=SEED)
+        for _ in stream.bars(1000):
+            pass
+        return 1000
+    return run
+
+
+@benchmark('midi_serialization', 'pure', 'notes')
+def bench_midi(tmp):
+    from music import compose_song
+    composer = compose_song('energetic', seed=SEED, duration_ms=600000)
+    events = composer.events
+
+    def run():
+        composer.to_midi()
+        return len(events)
+    return run
+
+
+@benchmark('preview_synth', 'pure', 'audio_seconds')
+def bench_preview_synth(tmp):
+    from music import PreviewSynth, compose_song
+    composer = compose_song('happy', seed=SEED, duration_ms=60000)
+
+    def run():
+        PreviewSynth().render(composer, 60000)
+        return 60
+    return run
+
+
+@benchmark('save_and_convert_preview_wav', 'pure', 'songs')
+def bench_save_preview_wav(tmp):
+    from music import compose_song
+    composer = compose_song('happy', seed=SEED, duration_ms=30000)
+
+    def run():
+        composer.save_and_convert(os.path.join(tmp, 'song'), None, 30000,
+                                  audio_format='wav', renderer='preview')
+        return 1
+    return run
+
+
+# Stages that run external binaries
+
+@benchmark('zoom_encode', 'external', 'frames')
+def bench_zoom_encode(tmp):
+    from moviepy.editor import ImageClip
+    from video_tools import write_videofile
+    need_binary('ffmpeg')
+    animation = load_script('4.1-extended-animatio.py')
+    image = synthetic_image(os.path.join(tmp, 'still.png'), size=FRAME_SIZE)
+    clip = animation.Zoom(ImageClip(image).set_fps(24).set_duration(2))
+
+    def run():
+        write_videofile(clip, os.path.join(tmp, 'zoom.mp4'), fps=24, logger=None)
+        return 48
+    return run
+
+
+@benchmark('overlay_videos_with_transparency', 'external', 'videos')
+def bench_overlay_videos(tmp):
+    need_binary('ffmpeg')
+    animation = load_script('4.1-extended-animatio.py')
+    a = synthetic_video(os.path.join(tmp, 'a.mp4'))
+    b = synthetic_video(os.path.join(tmp, 'b.mp4'), seed=SEED + 1)
+
+    def run():
+        animation.overlay_videos_with_transparency(a, b, os.path.join(tmp, 'out.mp4'), 0.5)
+        return 1
+    return run
+
+
+@benchmark('transition_between_videos', 'external', 'videos')
+def bench_transition_videos(tmp):
+    need_binary('ffmpeg')
+    animation = load_script('4.1-extended-animatio.py')
+    paths = [synthetic_video(os.path.join(tmp, f'v{i}.mp4'), seed=SEED + i)
+             for i in range(3)]
+
+    def run():
+        animation.apply_transition_between_videos(
+            paths, os.path.join(tmp, 'out.mp4'), ['crossfade', 'crossfade'])
+        return 1
+    return run
+
+
+@benchmark('join_videos', 'external', 'videos')
+def bench_join_videos(tmp):
+    need_binary('ffmpeg')
+    animation = load_script('4.1-extended-animatio.py')
+    paths = [synthetic_video(os.path.join(tmp, f'v{i}.mp4'), seed=SEED + i)
+             for i in range(3)]
+
+    def run():
+        animation.join_videos(paths, os.path.join(tmp, 'joined.mp4'))
+        return 1
+    return run
+
+
+@benchmark('create_slideshow', 'external', 'images')
+def bench_slideshow(tmp):
+    need_binary('ffmpeg')
+    slideshow = load_script('6-videoslide.py')
+    images = [synthetic_image(os.path.join(tmp, f'slide{i}.jpg'), size=(1600, 1200),
+                              seed=SEED + i) for i in range(8)]
+
+    def run():
+        slideshow.create_slideshow(images, 0.5, os.path.join(tmp, 'slideshow.mp4'),
+                                   size=FRAME_SIZE)
+        return len(images)
+    return run
+
+
+@benchmark('save_and_convert_fluidsynth', 'external', 'songs')
+def bench_save_fluidsynth(tmp):
+    from music import compose_song
+    need_binary('fluidsynth')
+    soundfont = os.environ.get('BENCH_SOUNDFONT', os.path.join(HERE, 'FluidR3_GM.sf2'))
+    if not os.path.exists(soundfont):
+        raise Skip(f"soundfont {soundfont} not found (set BENCH_SOUNDFONT)")
+    composer = compose_song('happy', seed=SEED, duration_ms=10000)
+
+    def run():
+        composer.save_and_convert(os.path.join(tmp, 'song'), soundfont, 10000,
+                                  audio_format='wav')
+        return 1
+    return run
+
+
+@benchmark('save_and_convert_preview_mp3', 'external', 'songs')
+def bench_save_preview_mp3(tmp):
+    from music import compose_song
+    need_binary('ffmpeg')  # pydub encodes MP3 with ffmpeg
+    composer = compose_song('happy', seed=SEED, duration_ms=30000)
+
+    def run():
+        composer.save_and_convert(os.path.join(tmp, 'song'), None, 30000,
+                                  audio_format='mp3', renderer='preview')
+        return 1
+    return run
+
+
+def measure(run, repeat):
+    run()  # warm up caches and lazy imports
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {
+        'units': units,
+        'seconds': times,
+        'best': best,
+        'median': statistics.median(times),
+        'throughput': units / best if best else None,
+        'peak_bytes': peak,
+    }
+
+
+def run_benchmarks(names, repeat=3):
+    results = {}
+    cwd = os.getcwd()
+    for name in names:
+        group, unit, setup = BENCHMARKS[name]
+        print(f"{name} ...", file=sys.stderr, flush=True)
+        # What the benchmarked code prints goes to stderr, so stdout
+        # carries only the report
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+            # Scripts that write next to themselves write into the scratch directory
+            os.chdir(tmp)
+            try:
+                result = {'group': group, 'unit': unit}
+                result.update(measure(setup(tmp), repeat))
+            except Skip as reason:
+                result = {'group': group, 'unit': unit, 'skipped': str(reason)}
+            finally:
+                os.chdir(cwd)
+        results[name] = result
+    return results
+
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """Names and descriptions of the results that regressed against baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        if result['best'] > base['best'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['best']:.4f}s vs baseline "
+                               f"{base['best']:.4f}s")
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak {result['peak_bytes']} bytes vs baseline "
+                               f"{base['peak_bytes']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--group', choices=['pure', 'external', 'all'], default='all')
+    parser.add_argument('-k', '--filter', default='',
+                        help="only run benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help="write the JSON report here")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    names = [name for name, (group, _, _) in BENCHMARKS.items()
+             if args.group in ('all', group) and args.filter in name]
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'results': run_benchmarks(names, args.repeat),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)['results']
+        baseline.update(report['results'])
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(report, results=baseline), f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(report['results'], baseline,
+                              args.tolerance, args.memory_tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    else:
+        print(f"warning: no baseline at {args.baseline}, nothing compared "
+              "(store one with --update-baseline)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""Frame compositing helpers shared by the video scripts."""
+import bisect
+import time
+
+import cv2
+import numpy as np
+from moviepy.audio.fx.all import audio_fadein, audio_fadeout
+from moviepy.editor import CompositeAudioClip, CompositeVideoClip, ImageClip, VideoClip
+
+from instrumentation import traced
+
+
+class Blender:
+    """Alpha blending of uint8 frames in fixed point, without allocations.
+
+    Weights are 8-bit fixed point and products are accumulated in uint16
+    scratch buffers that are allocated once per frame shape and reused, as
+    is the output buffer unless one is passed in. The returned frame is
+    overwritten by the next call with the same shape.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def _scratch(self, shape, name, dtype):
+        key = (shape, name)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = np.empty(shape, dtype)
+        return buffer
+
+    def blend(self, background, overlay, opacity, out=None):
+        """Constant opacity: overlay*opacity + background*(1-opacity)."""
+        background = np.asarray(background, dtype=np.uint8)
+        overlay = np.asarray(overlay, dtype=np.uint8)
+        shape = background.shape
+        acc = self._scratch(shape, 'acc', np.uint16)
+        tmp = self._scratch(shape, 'tmp', np.uint16)
+        if out is None:
+            out = self._scratch(shape, 'out', np.uint8)
+        weight = min(max(int(round(opacity * 256)), 0), 256)
+        np.multiply(overlay, weight, out=acc, dtype=np.uint16)
+        np.multiply(background, 256 - weight, out=tmp, dtype=np.uint16)
+        np.add(acc, tmp, out=acc)
+        np.add(acc, 128, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(out, acc, casting='unsafe')
+        return out
+
+    def blend_alpha(self, background, overlay, alpha, out=None, opacity=1.0):
+        """Per-pixel alpha (uint8, 255 = opaque), scaled by opacity."""
+        background = np.asarray(background, dtype=np.uint8)
+        overlay = np.asarray(overlay, dtype=np.uint8)
+        alpha = np.asarray(alpha, dtype=np.uint8)
+        shape = background.shape
+        if alpha.ndim == 2:
+            alpha = alpha[..., None]
+        acc = self._scratch(shape, 'acc', np.uint16)
+        tmp = self._scratch(shape, 'tmp', np.uint16)
+        weight = self._scratch(alpha.shape, 'alpha', np.uint16)
+        inverse = self._scratch(alpha.shape, 'inverse', np.uint16)
+        if out is None:
+            out = self._scratch(shape, 'out', np.uint8)
+        np.multiply(alpha, min(max(int(round(opacity * 256)), 0), 256),
+                    out=weight, dtype=np.uint16)
+        np.right_shift(weight, 8, out=weight)
+        np.subtract(255, weight, out=inverse)
+        np.multiply(overlay, weight, out=acc)
+        np.multiply(background, inverse, out=tmp)
+        np.add(acc, tmp, out=acc)
+        # Exact rounded division by 255: (x + 128 + ((x + 128) >> 8)) >> 8
+        np.add(acc, 128, out=acc)
+        np.right_shift(acc, 8, out=tmp)
+        np.add(acc, tmp, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(out, acc, casting='unsafe')
+        return out
+
+    def mask_to_alpha(self, mask):
+        """Convert a moviepy float mask (0..1) into a reused uint8 buffer."""
+        scaled = self._scratch(mask.shape, 'mask', np.float32)
+        alpha = self._scratch(mask.shape, 'mask_alpha', np.uint8)
+        np.multiply(mask, 255, out=scaled)
+        np.add(scaled, 0.5, out=scaled)
+        np.copyto(alpha, scaled, casting='unsafe')
+        return alpha
+
+
+_blender = Blender()
+
+
+def crossfade(frame_a, frame_b, progress):
+    return _blender.blend(frame_a, frame_b, progress)
+
+
+def blur_transition(frame_a, frame_b, progress, radius=5):
+    # Blur grows towards the middle of the window and clears again while
+    # the clips crossfade underneath
+    frame = crossfade(frame_a, frame_b, progress)
+    sigma = radius * (1 - abs(2*progress - 1))
+    if sigma < 0.1:
+        return frame
+    return cv2.GaussianBlur(frame, (0, 0), sigma)
+
+
+TRANSITIONS = {'crossfade': crossfade,
+               'blur': blur_transition}
+
+
+def letterbox(frame, size):
+    """Scale frame to fit in size keeping its aspect ratio, centred on black."""
+    (w, h), (fh, fw) = size, frame.shape[:2]
+    scale = min(w / fw, h / fh)
+    sw, sh = max(int(round(fw * scale)), 1), max(int(round(fh * scale)), 1)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    out = np.zeros((h, w) + frame.shape[2:], np.uint8)
+    x, y = (w - sw) // 2, (h - sh) // 2
+    out[y:y + sh, x:x + sw] = cv2.resize(frame, (sw, sh), interpolation=interpolation)
+    return out
+
+
+class Timeline:
+    """Clips laid out on one flat timeline with transitions between them.
+
+    transitions[i] names the transition between clips i and i+1; names not
+    in TRANSITIONS give a hard cut. Clips of another size than the first
+    are letterboxed to its size. Clip start times are kept sorted, so
+    each frame finds the clip active at time t with a binary search and
+    evaluates at most two clips, only inside a transition window.
+    """
+
+    def __init__(self, clips, transitions, transition_duration=1):
+        self.clips = clips
+        self.size = tuple(clips[0].size)
+        self.starts = []
+        self.overlaps = []
+        self.transitions = []
+        t = 0
+        for i, clip in enumerate(clips):
+            transition = TRANSITIONS.get(transitions[i-1]) if i else None
+            overlap = 0
+            if transition is not None:
+                # Keep windows short enough that no three clips overlap
+                overlap = min(transition_duration, clip.duration / 2,
+                              clips[i-1].duration / 2)
+            t -= overlap
+            self.starts.append(t)
+            self.overlaps.append(overlap)
+            self.transitions.append(transition)
+            t += clip.duration
+        self.duration = t
+
+    def _frame(self, i, t):
+        clip = self.clips[i]
+        # Generated clips (ColorClip, make_frame functions) may give int64
+        # or float frames
+        frame = np.asarray(clip.get_frame(min(t - self.starts[i], clip.duration)),
+                           dtype=np.uint8)
+        if frame.shape[1::-1] != self.size:
+            frame = letterbox(frame, self.size)
+        return frame
+
+    @traced('timeline.frame', 'frame')
+    def make_frame(self, t):
+        i = max(bisect.bisect_right(self.starts, t) - 1, 0)
+        overlap = self.overlaps[i]
+        if overlap and t < self.starts[i] + overlap:
+            progress = (t - self.starts[i]) / overlap
+            return self.transitions[i](self._frame(i - 1, t),
+                                       self._frame(i, t), progress)
+        return self._frame(i, t)
+
+    def audio(self):
+        tracks = []
+        for i, clip in enumerate(self.clips):
+            if clip.audio is None:
+                continue
+            audio = clip.audio
+            if self.overlaps[i]:
+                audio = audio.fx(audio_fadein, self.overlaps[i])
+            if i + 1 < len(self.clips) and self.overlaps[i+1]:
+                audio = audio.fx(audio_fadeout, self.overlaps[i+1])
+            tracks.append(audio.set_start(self.starts[i]))
+        return CompositeAudioClip(tracks) if tracks else None
+
+    def to_clip(self):
+        clip = VideoClip(self.make_frame, duration=self.duration)
+        audio = self.audio()
+        return clip.set_audio(audio) if audio is not None else clip
+
+
+# moviepy's shorthand positions
+POSITIONS = {'center': ('center', 'center'),
+             'left': ('left', 'center'),
+             'right': ('right', 'center'),
+             'top': ('center', 'top'),
+             'bottom': ('center', 'bottom')}
+
+
+def _placement(size, overlay_size, pos):
+    # Overlapping (background, overlay) slices for a moviepy-style position
+    if isinstance(pos, str):
+        pos = POSITIONS[pos]
+    (w, h), (ow, oh) = size, overlay_size
+    x = {'left': 0, 'center': (w - ow) // 2, 'right': w - ow}.get(pos[0], pos[0])
+    y = {'top': 0, 'center': (h - oh) // 2, 'bottom': h - oh}.get(pos[1], pos[1])
+    x, y = int(x), int(y)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + ow, w), min(y + oh, h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return ((slice(y0, y1), slice(x0, x1)),
+            (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)))
+
+
+class Overlay:
+    """An overlay clip blended over a background clip at a fixed position.
+
+    Frames are blended with a Blender into one reused output frame; the
+    overlay's own mask, if it has one, is used as per-pixel alpha.
+    """
+
+    def __init__(self, background, overlay, opacity=1.0, pos='center'):
+        self.background = background
+        self.overlay = overlay
+        self.opacity = opacity
+        self.pos = pos
+        self.size = tuple(background.size)
+        self.duration = max(background.duration, overlay.duration)
+        self.blender = Blender()
+        self.frame = np.zeros((self.size[1], self.size[0], 3), np.uint8)
+
+    @traced('overlay.frame', 'frame')
+    def make_frame(self, t):
+        frame = self.frame
+        if t < self.background.duration:
+            np.copyto(frame, self.background.get_frame(t), casting='unsafe')
+        else:
+            frame.fill(0)
+        if t >= self.overlay.duration:
+            return frame
+        region = _placement(self.size, self.overlay.size, self.pos)
+        if region is None:
+            return frame
+        target, source = region
+        overlay = self.overlay.get_frame(t)[source]
+        if self.overlay.mask is None:
+            self.blender.blend(frame[target], overlay, self.opacity,
+                               out=frame[target])
+        else:
+            alpha = self.blender.mask_to_alpha(self.overlay.mask.get_frame(t))
+            self.blender.blend_alpha(frame[target], overlay, alpha[source],
+                                     out=frame[target], opacity=self.opacity)
+        return frame
+
+    def to_clip(self):
+        clip = VideoClip(self.make_frame, duration=self.duration)
+        tracks = [c.audio for c in (self.background, self.overlay)
+                  if c.audio is not None]
+        return clip.set_audio(CompositeAudioClip(tracks)) if tracks else clip
+
+
+class StaticLayer:
+    """A still RGBA raster at a fixed position with an opacity envelope."""
+
+    def __init__(self, rgb, alpha=None, pos='center', start=0, end=None,
+                 fadein=0, fadeout=0):
+        self.rgb = rgb
+        self.alpha = alpha
+        self.pos = pos
+        self.start = start
+        self.end = end
+        self.fadein = fadein
+        self.fadeout = fadeout
+
+    @property
+    def size(self):
+        return self.rgb.shape[1], self.rgb.shape[0]
+
+    def opacity(self, t):
+        if t < self.start or (self.end is not None and t >= self.end):
+            return 0.0
+        opacity = 1.0
+        if self.fadein:
+            opacity = min(opacity, (t - self.start) / self.fadein)
+        if self.fadeout and self.end is not None:
+            opacity = min(opacity, (self.end - t) / self.fadeout)
+        return opacity
+
+
+def static_layer(clip, start=0, fadein=0, fadeout=0):
+    """StaticLayer from an ImageClip, such as one made by text_clip.
+
+    The clip must not move: its position is read once, at t=0.
+    """
+    alpha = None
+    if clip.mask is not None:
+        alpha = np.rint(clip.mask.get_frame(0) * 255).astype(np.uint8)
+    end = start + clip.duration if clip.duration is not None else None
+    return StaticLayer(clip.get_frame(0), alpha, clip.pos(0), start, end,
+                       fadein, fadeout)
+
+
+def is_static(clip):
+    """Whether a clip's picture, mask and position never change.
+
+    An ImageClip keeps its class only through time-invariant transforms
+    (fl_image, set_opacity); fl and the fades make it a plain VideoClip.
+    The position is taken as fixed when it is the same at five times
+    across the clip.
+    """
+    if not isinstance(clip, ImageClip):
+        return False
+    if clip.mask is not None and not isinstance(clip.mask, ImageClip):
+        return False
+    times = np.linspace(0, clip.duration, 5) if clip.duration else [0]
+    first = clip.pos(0)
+    return all(clip.pos(t) == first for t in times)
+
+
+class ClipLayer:
+    """A clip that changes over time, drawn afresh on every frame."""
+
+    def __init__(self, clip, start=0):
+        self.clip = clip
+        self.start = start
+        self.end = start + clip.duration if clip.duration is not None else None
+
+    def opacity(self, t):
+        if t < self.start or (self.end is not None and t >= self.end):
+            return 0.0
+        return 1.0
+
+
+class LayerStack:
+    """Layers composited over a solid background colour.
+
+    Layers are StaticLayers or moviepy clips. Clips that never change (see
+    is_static) are turned into StaticLayers, rasterized once; the others
+    are drawn from the clip on every frame. Static layers' opacities are
+    quantized to the Blender's 1/256 steps; while they stay the same and
+    no changing clip is on screen, as in the hold between a fade-in and a
+    fade-out, the previous frame is returned without being composited
+    again.
+    """
+
+    def __init__(self, layers, size, bg_color=(0, 0, 0)):
+        self.layers = [layer if isinstance(layer, StaticLayer)
+                       else static_layer(layer, layer.start) if is_static(layer)
+                       else ClipLayer(layer, layer.start)
+                       for layer in layers]
+        self.size = tuple(size)
+        self.background = np.empty((self.size[1], self.size[0], 3), np.uint8)
+        self.background[:] = bg_color
+        self.frame = self.background.copy()
+        self.regions = [_placement(self.size, layer.size, layer.pos)
+                        if isinstance(layer, StaticLayer) else None
+                        for layer in self.layers]
+        self.blender = Blender()
+        self._weights = None
+
+    def _draw_clip(self, layer, t):
+        clip, t = layer.clip, t - layer.start
+        region = _placement(self.size, clip.size, clip.pos(t))
+        if region is None:
+            return
+        target, source = region
+        rgb = clip.get_frame(t)[source]
+        if clip.mask is None:
+            self.blender.blend(self.frame[target], rgb, 1.0, out=self.frame[target])
+        else:
+            alpha = self.blender.mask_to_alpha(clip.mask.get_frame(t))
+            self.blender.blend_alpha(self.frame[target], rgb, alpha[source],
+                                     out=self.frame[target])
+
+    @traced('layer_stack.frame', 'frame')
+    def make_frame(self, t):
+        weights = tuple(min(max(int(round(layer.opacity(t) * 256)), 0), 256)
+                        for layer in self.layers)
+        changing = any(weight and isinstance(layer, ClipLayer)
+                       for layer, weight in zip(self.layers, weights))
+        if weights == self._weights and not changing:
+            return self.frame
+        np.copyto(self.frame, self.background)
+        for layer, region, weight in zip(self.layers, self.regions, weights):
+            if not weight:
+                continue
+            if isinstance(layer, ClipLayer):
+                self._draw_clip(layer, t)
+                continue
+            if region is None:
+                continue
+            target, source = region
+            if layer.alpha is None:
+                self.blender.blend(self.frame[target], layer.rgb[source],
+                                   weight / 256, out=self.frame[target])
+            else:
+                self.blender.blend_alpha(
+                    self.frame[target], layer.rgb[source],
+                    layer.alpha[source], out=self.frame[target],
+                    opacity=weight / 256)
+        # A frame with a changing clip is never reused
+        self._weights = None if changing else weights
+        return self.frame
+
+    def to_clip(self, duration):
+        return VideoClip(self.make_frame, duration=duration)
+
+
+def benchmark_overlay(size=(1920, 1080), frames=60, opacity=0.5):
+    """Frames per second of Overlay against set_opacity+CompositeVideoClip."""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    overlay = rng.integers(0, 256, (size[1] // 2, size[0] // 2, 3),
+                           dtype=np.uint8)
+    duration = frames / 24
+    bg_clip = VideoClip(lambda t: background, duration=duration)
+    ov_clip = VideoClip(lambda t: overlay, duration=duration)
+    candidates = {
+        'composite': CompositeVideoClip([
+            bg_clip, ov_clip.set_opacity(opacity).set_position('center')]),
+        'overlay': Overlay(bg_clip, ov_clip, opacity).to_clip(),
+    }
+    results = {}
+    for name, clip in candidates.items():
+        start = time.perf_counter()
+        for i in range(frames):
+            clip.get_frame(i / 24)
+        results[name] = frames / (time.perf_counter() - start)
+    results['speedup'] = results['overlay'] / results['composite']
+    return results
+
+
+if __name__ == '__main__':
+    for name, value in benchmark_overlay().items():
+        print(f"{name}: {value:.1f}")
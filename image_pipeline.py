@@ -0,0 +1,279 @@
+"""Lazy image pipelines: declare operations once, run them over many files.
+
+A pipeline is a small graph of operations rooted at the decoded source
+image. Nothing runs until the pipeline is applied to an image or a set of
+files; then each source is decoded once, every intermediate result is
+computed once and shared by the outputs derived from it, and results are
+written to disk as soon as they are ready.
+"""
+import glob
+import multiprocessing
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+
+def _brightness(img, factor):
+    return ImageEnhance.Brightness(img).enhance(factor)
+
+
+def _contrast(img, factor):
+    return ImageEnhance.Contrast(img).enhance(factor)
+
+
+def _levels(values, black, white):
+    return (values - black) * 255.0 / max(white - black, 1)
+
+
+@lru_cache(maxsize=128)
+def _curve(steps, pivots):
+    # Compose the steps into one table; pivots holds the contrast mean for
+    # each contrast step. Every step truncates and clips to 0..255 like
+    # Image.blend does, so brightness/contrast match ImageEnhance.
+    values = np.arange(256, dtype=np.float64)
+    pivots = iter(pivots)
+    for name, arg in steps:
+        if name == 'brightness':
+            values = values * arg
+        elif name == 'contrast':
+            mean = next(pivots)
+            values = mean + arg * (values - mean)
+        elif name == 'gamma':
+            values = 255.0 * (values / 255.0) ** (1.0 / arg) + 0.5
+        elif name == 'levels':
+            values = _levels(values, *arg) + 0.5
+        values = np.floor(np.clip(values, 0, 255))
+    return tuple(int(v) for v in values)
+
+
+class Adjustments:
+    """A chain of pointwise adjustments fused into one lookup table.
+
+    Brightness, contrast, gamma and levels are composed into a single
+    256-entry table per band and applied in one Image.point() pass instead
+    of one full-image pass and intermediate image per step. Contrast pivots
+    on the mean grey level of the image as it reaches that step, like
+    ImageEnhance.Contrast; the mean comes from one histogram of the source
+    (the grey mean is taken from the band means, so it can be off by one
+    level from ImageEnhance's). Tables are cached on the chain and the
+    means, so they are reused across a batch of images.
+    """
+
+    # Modes the table is built for; others are converted to RGB first
+    MODES = ('L', 'RGB', 'RGBA')
+
+    def __init__(self, steps=()):
+        self.steps = tuple(steps)
+
+    def _then(self, name, arg):
+        return Adjustments(self.steps + ((name, arg),))
+
+    def brightness(self, factor):
+        return self._then('brightness', factor)
+
+    def contrast(self, factor):
+        return self._then('contrast', factor)
+
+    def gamma(self, gamma):
+        if gamma <= 0:
+            raise ValueError(f"gamma must be positive, got {gamma}")
+        return self._then('gamma', gamma)
+
+    def levels(self, black=0, white=255):
+        return self._then('levels', (black, white))
+
+    def _pivots(self, img):
+        # Mean grey level in front of each contrast step, from one histogram
+        if not any(name == 'contrast' for name, _ in self.steps):
+            return ()
+        histogram = np.array(img.histogram(), dtype=np.float64)
+        bands = histogram.reshape(-1, 256)[:3]
+        weights = (0.299, 0.587, 0.114) if len(bands) == 3 else (1.0,)
+        pixels = bands[0].sum()
+        pivots = []
+        for i, (name, _) in enumerate(self.steps):
+            if name == 'contrast':
+                table = np.array(_curve(self.steps[:i], tuple(pivots)))
+                means = bands @ table / pixels
+                pivots.append(int(np.dot(weights, means) + 0.5))
+        return tuple(pivots)
+
+    def table(self, img):
+        """Lookup table for img, in the layout Image.point() expects."""
+        curve = list(_curve(self.steps, self._pivots(img)))
+        if img.mode == 'L':
+            return curve
+        table = curve * 3
+        if img.mode == 'RGBA':
+            table += list(range(256))
+        return table
+
+    def apply(self, img):
+        if img.mode not in self.MODES:
+            img = img.convert('RGB')
+        return img.point(self.table(img))
+
+
+def _adjust(img, adjustments):
+    return adjustments.apply(img)
+
+
+def _adjust_resize(img, adjustments, size, **kwargs):
+    # The adjustments are pointwise, so up to rounding they give the same
+    # result before or after the resize: run the lookup pass on whichever
+    # side has fewer pixels
+    if img.mode not in Adjustments.MODES:
+        img = img.convert('RGB')
+    if size[0] * size[1] < img.width * img.height:
+        return adjustments.apply(img.resize(size, **kwargs))
+    return adjustments.apply(img).resize(size, **kwargs)
+
+
+# Operations by name; each takes the image followed by its arguments
+OPERATIONS = {
+    'filter': Image.Image.filter,
+    'rotate': Image.Image.rotate,
+    'crop': Image.Image.crop,
+    'resize': Image.Image.resize,
+    'convert': Image.Image.convert,
+    'flip': ImageOps.flip,
+    'mirror': ImageOps.mirror,
+    'brightness': _brightness,
+    'contrast': _contrast,
+    'adjust': _adjust,
+    'adjust_resize': _adjust_resize,
+}
+
+
+class Node:
+    """One operation in a pipeline, applied to the result of its parent."""
+
+    def __init__(self, pipeline, parent=None, op=None, args=(), kwargs=None):
+        self.pipeline = pipeline
+        self.parent = parent
+        self.op = op
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def apply(self, op, *args, **kwargs):
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown image operation '{op}'")
+        return Node(self.pipeline, self, op, args, kwargs)
+
+    def filter(self, image_filter):
+        return self.apply('filter', image_filter)
+
+    def rotate(self, angle, **kwargs):
+        return self.apply('rotate', angle, **kwargs)
+
+    def crop(self, box):
+        return self.apply('crop', box)
+
+    def resize(self, size, **kwargs):
+        return self.apply('resize', size, **kwargs)
+
+    def convert(self, mode):
+        return self.apply('convert', mode)
+
+    def flip(self):
+        return self.apply('flip')
+
+    def mirror(self):
+        return self.apply('mirror')
+
+    def brightness(self, factor):
+        return self.apply('brightness', factor)
+
+    def contrast(self, factor):
+        return self.apply('contrast', factor)
+
+    def adjust(self, adjustments):
+        return self.apply('adjust', adjustments)
+
+    def adjust_resize(self, adjustments, size, **kwargs):
+        """Adjust and resize, adjusting at the smaller of the two sizes."""
+        return self.apply('adjust_resize', adjustments, size, **kwargs)
+
+    def save(self, name_format, **save_kwargs):
+        """Write this node's result; name_format may use {stem}."""
+        self.pipeline.outputs.append((self, name_format, save_kwargs))
+        return self
+
+
+class ImagePipeline:
+    """A graph of image operations with any number of saved outputs."""
+
+    def __init__(self):
+        self.source = Node(self)
+        self.outputs = []
+
+    def run_image(self, img, stem, output_dir='.'):
+        """Apply the pipeline to an already decoded image."""
+        results = {id(self.source): img}
+
+        def evaluate(node):
+            key = id(node)
+            if key not in results:
+                results[key] = OPERATIONS[node.op](
+                    evaluate(node.parent), *node.args, **node.kwargs)
+            return results[key]
+
+        paths = []
+        for node, name_format, save_kwargs in self.outputs:
+            path = os.path.join(output_dir, name_format.format(stem=stem))
+            evaluate(node).save(path, **save_kwargs)
+            paths.append(path)
+        return paths
+
+    def run_file(self, path, output_dir='.'):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        with Image.open(path) as img:
+            img.load()
+            return self.run_image(img, stem, output_dir)
+
+    def run_files(self, paths, output_dir='.', workers=None, chunksize=4):
+        """Run over many files in parallel; returns the number processed.
+
+        Files are handed to the worker processes one chunk at a time and
+        nothing is kept once its outputs are written, so memory stays
+        bounded however many files there are.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        if workers == 1:
+            for path in paths:
+                self.run_file(path, output_dir)
+                count += 1
+            return count
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(self, output_dir))
+        try:
+            for _ in pool.imap_unordered(_run_worker_file, paths,
+                                         chunksize=chunksize):
+                count += 1
+        finally:
+            pool.close()
+            pool.join()
+        return count
+
+    def run(self, input_dir, output_dir, pattern='*.png', workers=None):
+        """Run over every file in input_dir matching pattern."""
+        paths = sorted(glob.iglob(os.path.join(input_dir, pattern)))
+        return self.run_files(paths, output_dir, workers)
+
+
+# Pipeline held by each worker process, sent once when the pool starts
+_worker_pipeline = None
+_worker_output_dir = None
+
+
+def _init_worker(pipeline, output_dir):
+    global _worker_pipeline, _worker_output_dir
+    _worker_pipeline = pipeline
+    _worker_output_dir = output_dir
+
+
+def _run_worker_file(path):
+    return _worker_pipeline.run_file(path, _worker_output_dir)
@@ -0,0 +1,303 @@
+"""Opt-in timing of render and audio stages.
+
+Set RENDER_TRACE to turn recording on: to 1 to print a summary when the
+process exits, or to a file name to also write a Chrome trace there (open
+it in chrome://tracing or https://ui.perfetto.dev). From code, call
+enable() and later print_summary() or write_chrome_trace().
+
+    with span('encode', path=output_path):
+        ...
+    count('bytes_written', os.path.getsize(output_path))
+
+Spans record wall time per stage, or per frame with category 'frame';
+counters add up frames, bytes and the like. While recording is off, span()
+returns a shared do-nothing context manager and count() returns at once,
+so the hooks can stay in per-frame code.
+
+Worker processes forked by multiprocessing record too: each starts with
+empty records and, when it exits after pool.close() and pool.join(),
+leaves them in a spool directory for the parent to merge into its
+summary and trace. A pool that is terminated loses its workers' records.
+
+While recording, set RENDER_PROFILE to a span name to run the sampling
+profiler during the first span of that name. Its stacks are written to
+<name>.folded, in the collapsed format flamegraph.pl and speedscope read.
+"""
+import atexit
+import collections
+import functools
+import json
+import multiprocessing.util
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+_enabled = False
+_trace_path = None
+_profile_span = os.environ.get('RENDER_PROFILE') or None
+_events = []
+_counters = collections.Counter()
+_origin = time.perf_counter()
+# Where worker processes leave their records
+_spool_dir = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region, recorded when it exits."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.profiler = None
+
+    def __enter__(self):
+        global _profile_span
+        if self.name == _profile_span:
+            _profile_span = None  # only the first one
+            self.profiler = SamplingProfiler().start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _events.append((self.name, self.category, self.start, end - self.start,
+                        os.getpid(), threading.get_ident(), self.args))
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.write_collapsed(f"{self.name}.folded")
+        return False
+
+
+def span(name, category='stage', **args):
+    """Context manager timing one stage or frame."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, category, args)
+
+
+def traced(name=None, category='stage'):
+    """Decorator timing every call of a function."""
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(label, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    """Add value to a counter such as 'frames' or 'bytes_written'."""
+    if _enabled:
+        _counters[name] += value
+
+
+def count_file(name, path):
+    """Add the size of a file that was just written to a byte counter."""
+    if _enabled:
+        _counters[name] += os.path.getsize(path)
+
+
+def enable(trace_path=None):
+    global _enabled, _trace_path, _spool_dir
+    _enabled = True
+    _trace_path = trace_path
+    if _spool_dir is None:
+        _spool_dir = tempfile.mkdtemp(prefix='render-trace-')
+        atexit.register(shutil.rmtree, _spool_dir, ignore_errors=True)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    _merge_workers()
+    del _events[:]
+    _counters.clear()
+
+
+def _start_worker(_):
+    """Run in each new multiprocessing worker, before its task."""
+    # Only what this process records goes back to the parent
+    del _events[:]
+    _counters.clear()
+    if _enabled and _spool_dir is not None:
+        multiprocessing.util.Finalize(None, _flush_worker, exitpriority=100)
+
+
+multiprocessing.util.register_after_fork(_start_worker, _start_worker)
+
+
+def _flush_worker():
+    if not _events and not _counters:
+        return
+    try:
+        fd, path = tempfile.mkstemp(dir=_spool_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((_events, _counters), f)
+        # Renamed when complete, so the parent never reads half a file
+        os.replace(path, path[:-len('.tmp')] + '.pickle')
+    except OSError:
+        pass  # the parent is gone
+
+
+def _merge_workers():
+    """Move the records of finished workers into this process's."""
+    if _spool_dir is None:
+        return
+    try:
+        names = sorted(os.listdir(_spool_dir))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith('.pickle'):
+            continue
+        path = os.path.join(_spool_dir, name)
+        with open(path, 'rb') as f:
+            events, counters = pickle.load(f)
+        os.remove(path)
+        _events.extend(events)
+        _counters.update(counters)
+
+
+def summary():
+    """Per-span totals (calls, total/mean/max seconds) and the counters."""
+    _merge_workers()
+    spans = {}
+    for name, category, _, duration, _, _, _ in _events:
+        stats = spans.setdefault(name, {'category': category, 'calls': 0,
+                                        'total': 0.0, 'max': 0.0})
+        stats['calls'] += 1
+        stats['total'] += duration
+        stats['max'] = max(stats['max'], duration)
+    for stats in spans.values():
+        stats['mean'] = stats['total'] / stats['calls']
+    return {'spans': spans, 'counters': dict(_counters)}
+
+
+def print_summary(file=sys.stderr):
+    report = summary()
+    spans = sorted(report['spans'].items(), key=lambda item: -item[1]['total'])
+    print(f"{'span':40} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}",
+          file=file)
+    for name, stats in spans:
+        print(f"{name:40} {stats['calls']:8d} {stats['total']:10.3f} "
+              f"{stats['mean'] * 1000:10.3f} {stats['max'] * 1000:10.3f}", file=file)
+    for name, value in sorted(report['counters'].items()):
+        print(f"{name:40} {value:>8}", file=file)
+
+
+def write_chrome_trace(path):
+    """Write the recorded spans in the Chrome trace event format."""
+    _merge_workers()
+    events = [{'name': name, 'cat': category, 'ph': 'X',
+               'ts': (start - _origin) * 1e6, 'dur': duration * 1e6,
+               'pid': pid, 'tid': tid, 'args': {k: str(v) for k, v in args.items()}}
+              for name, category, start, duration, pid, tid, args in _events]
+    events += [{'name': name, 'ph': 'C', 'ts': 0, 'pid': os.getpid(),
+                'args': {name: value}} for name, value in _counters.items()]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval.
+
+    A background thread reads the target thread's frame from
+    sys._current_frames(), so the profiled code runs unmodified and the
+    cost is one stack walk per interval.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                             f":{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def top(self, n=20):
+        """The n functions seen most often at the top of the stack, with sample counts."""
+        leaves = collections.Counter()
+        for stack, samples in self.stacks.items():
+            leaves[stack[-1]] += samples
+        return leaves.most_common(n)
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(';'.join(stack) + f" {samples}\n")
+
+
+def profile(interval=0.005):
+    """Sample the calling thread for the duration of a with block."""
+    return SamplingProfiler(interval)
+
+
+def _at_exit():
+    _merge_workers()
+    if not _events and not _counters:
+        return
+    print_summary()
+    if _trace_path:
+        write_chrome_trace(_trace_path)
+
+
+if os.environ.get('RENDER_TRACE'):
+    setting = os.environ['RENDER_TRACE']
+    enable(None if setting == '1' else setting)
+    atexit.register(_at_exit)
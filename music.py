@@ -1,10 +1,26 @@
 from dataclasses import dataclass
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Iterator, Tuple, Optional
 import random
-from midiutil import MIDIFile
-from midi2audio import FluidSynth
 from pydub import AudioSegment
+import multiprocessing
 import os
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+from moviepy.config import get_setting
+from instrumentation import count_file, span, traced
+from render_cache import ContentCache, content_key, file_digest
+try:
+    import fluidsynth  # pyfluidsynth, for SynthWorker
+except ImportError:
+    fluidsynth = None
+
+# pydub encodes mp3 with the ffmpeg on PATH; without one, use moviepy's
+if not shutil.which(AudioSegment.converter):
+    AudioSegment.converter = get_setting('FFMPEG_BINARY')
+
 class MusicTheory:
     """Constants and music theory data structures."""
     NOTES: List[int] = (60, 61, 62, 63, 64, 65, 66, 67, 68, 69, 70, 71)
@@ -79,34 +95,190 @@ class MusicTheory:
         'competition': ['melodic_minor', 'harmonic_minor']
     }
     MOOD_WITH_STRINGS: List[str] = ['sad', 'gloomy']
+# One row per note; start and duration are in beats
+NOTE_DTYPE = np.dtype([
+    ('pitch', np.uint8),
+    ('start', np.float64),
+    ('duration', np.float32),
+    ('velocity', np.uint8),
+    ('channel', np.uint8),
+    ('track', np.uint8),
+])
+
+DRUM_CHANNEL = 9
+BEATS_PER_BAR = 2.0
+TICKS_PER_BEAT = 960
+
+def _track_chunk(ticks: np.ndarray, messages: np.ndarray) -> bytes:
+    """Encode sorted (tick, 3-byte message) events as an MTrk chunk."""
+    deltas = np.diff(ticks, prepend=0).astype(np.uint32)
+    # Variable-length delta times: 7 bits per byte, most significant first
+    lengths = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    sizes = lengths + 3
+    offsets = np.cumsum(sizes) - sizes
+    data = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(4):
+        has = lengths > k
+        byte = (deltas[has] >> (7 * k)) & 0x7F
+        if k:
+            byte |= 0x80
+        data[offsets[has] + lengths[has] - 1 - k] = byte.astype(np.uint8)
+    ends = offsets + lengths
+    for i in range(3):
+        data[ends + i] = messages[:, i]
+    body = data.tobytes() + b'\x00\xff\x2f\x00'  # end of track
+    return b'MTrk' + len(body).to_bytes(4, 'big') + body
+
+class NoteTable:
+    """Notes of one or more tracks as a structured NumPy array.
+    
+    Every generator produces a table and the composer concatenates them,
+    so a song is a handful of contiguous arrays instead of one Python
+    tuple per note. Transforms work on whole columns and return new
+    tables; rows are kept in the order they were generated.
+    """
+    
+    def __init__(self, events: Optional[np.ndarray] = None):
+        self.events = np.empty(0, dtype=NOTE_DTYPE) if events is None else events
+    
+    @classmethod
+    def from_arrays(cls, pitch, start, duration, velocity,
+                    channel=0, track=0) -> 'NoteTable':
+        """Build a table from columns; scalars are broadcast."""
+        columns = {'pitch': pitch, 'start': start, 'duration': duration,
+                   'velocity': velocity, 'channel': channel, 'track': track}
+        lengths = [np.size(values) for values in columns.values() if np.ndim(values)]
+        events = np.empty(lengths[0] if lengths else 1, dtype=NOTE_DTYPE)
+        for name, values in columns.items():
+            events[name] = values
+        return cls(events)
+    
+    @classmethod
+    def concat(cls, tables: List['NoteTable']) -> 'NoteTable':
+        if not tables:
+            return cls()
+        return cls(np.concatenate([table.events for table in tables]))
+    
+    def __len__(self) -> int:
+        return len(self.events)
+    
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.events[column]
+    
+    def _with(self, **columns) -> 'NoteTable':
+        events = self.events.copy()
+        for name, values in columns.items():
+            events[name] = values
+        return NoteTable(events)
+    
+    def assign(self, track: int, channel: int) -> 'NoteTable':
+        """Copy of the table moved to the given track and channel."""
+        return self._with(track=track, channel=channel)
+    
+    def transpose(self, semitones: int) -> 'NoteTable':
+        """Shift every pitch except drums, which would change instrument."""
+        pitch = self.events['pitch'].astype(np.int16)
+        melodic = self.events['channel'] != DRUM_CHANNEL
+        pitch[melodic] += semitones
+        return self._with(pitch=np.clip(pitch, 0, 127))
+    
+    def shift(self, beats: float) -> 'NoteTable':
+        return self._with(start=self.events['start'] + beats)
+    
+    def quantize(self, grid: float = 0.25) -> 'NoteTable':
+        """Snap starts and ends to the grid, keeping at least one step per note."""
+        start = np.round(self.events['start'] / grid) * grid
+        end = np.round((self.events['start'] + self.events['duration']) / grid) * grid
+        return self._with(start=start, duration=np.maximum(end - start, grid))
+    
+    def humanize(self, velocity: int = 8, timing: float = 0.0,
+                 seed: Optional[int] = None) -> 'NoteTable':
+        """Randomly vary velocities by up to +-velocity and starts by up to +-timing beats."""
+        rng = np.random.default_rng(seed)
+        count = len(self.events)
+        velocities = self.events['velocity'] + rng.integers(-velocity, velocity + 1, count)
+        start = self.events['start'] + rng.uniform(-timing, timing, count)
+        return self._with(velocity=np.clip(velocities, 1, 127), start=np.maximum(start, 0))
+    
+    def unique(self) -> 'NoteTable':
+        """Drop repeated identical notes, keeping the first of each."""
+        _, first = np.unique(self.events, return_index=True)
+        return NoteTable(self.events[np.sort(first)])
+    
+    def truncate(self, max_beats: float) -> 'NoteTable':
+        """Drop notes starting after max_beats and cut the rest short there."""
+        events = self.events[self.events['start'] < max_beats]
+        events['duration'] = np.minimum(events['duration'], max_beats - events['start'])
+        return NoteTable(events)
+    
+    def to_midi(self, tempo: int, programs: Optional[Dict[int, int]] = None,
+                ticks_per_beat: int = TICKS_PER_BEAT) -> bytes:
+        """Serialize as a format 1 Standard MIDI File.
+        
+        The first track holds the tempo and the program of each channel in
+        programs, followed by one track per track number. All note messages
+        are encoded with array operations.
+        """
+        events = self.events
+        tracks = int(events['track'].max()) + 1 if len(events) else 0
+        
+        conductor = [0xFF, 0x51, 0x03, *round(60000000 / tempo).to_bytes(3, 'big')]
+        for channel, program in sorted((programs or {}).items()):
+            conductor += [0x00, 0xC0 | channel, program]
+        conductor = bytes([0x00] + conductor) + b'\x00\xff\x2f\x00'
+        chunks = [b'MTrk' + len(conductor).to_bytes(4, 'big') + conductor]
+        
+        start = np.round(events['start'] * ticks_per_beat).astype(np.int64)
+        end = np.round((events['start'] + events['duration']) * ticks_per_beat).astype(np.int64)
+        ticks = np.concatenate([start, np.maximum(end, start)])
+        is_on = np.repeat(np.array([1, 0], dtype=np.uint8), len(events))
+        track = np.tile(events['track'], 2)
+        messages = np.empty((len(ticks), 3), dtype=np.uint8)
+        messages[:, 0] = np.tile(events['channel'], 2) | np.where(is_on, 0x90, 0x80)
+        messages[:, 1] = np.tile(events['pitch'], 2)
+        messages[:, 2] = np.where(is_on, np.tile(events['velocity'], 2), 0)
+        # Within a track, note-offs go before note-ons at the same tick
+        order = np.lexsort((is_on, ticks, track))
+        bounds = np.searchsorted(track[order], np.arange(tracks + 1))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            rows = order[a:b]
+            chunks.append(_track_chunk(ticks[rows], messages[rows]))
+        
+        header = b'MThd' + (6).to_bytes(4, 'big') + b''.join(
+            n.to_bytes(2, 'big') for n in (1, len(chunks), ticks_per_beat))
+        return header + b''.join(chunks)
+
 class ScaleGenerator:
     """Handles scale and chord generation based on mood."""
     
     def __init__(self, theory: MusicTheory):
         self.theory = theory
     
-    def get_scale_for_mood(self, mood: str) -> Tuple[List[int], List[List[int]]]:
+    def get_scale_for_mood(self, mood: str, rng: Optional[random.Random] = None
+                           ) -> Tuple[List[int], List[List[int]]]:
         """Generate scale and chord progression based on mood."""
+        rng = rng or random
         scale_types = self.theory.MOOD_SCALES.get(mood.lower())
         if not scale_types:
             print(f"Mood '{mood}' not recognized. Defaulting to 'major'.")
             scale_type = 'major'
         else:
-            scale_type = random.choice(scale_types)
+            scale_type = rng.choice(scale_types)
         
-        root_note = random.choice(self.theory.NOTES)
-        chord_progression = self._generate_chord_progression(root_note, scale_type)
+        root_note = rng.choice(self.theory.NOTES)
+        chord_progression = self._generate_chord_progression(root_note, scale_type, rng)
         scale = self._generate_scale(root_note, scale_type)
         
         return scale, chord_progression
     
-    def _generate_chord_progression(self, root_note: int, scale_type: str) -> List[List[int]]:
+    def _generate_chord_progression(self, root_note: int, scale_type: str,
+                                    rng: Optional[random.Random] = None) -> List[List[int]]:
         """Generate chord progression with optional seventh notes."""
         base_progression = self.theory.SCALE_CHORDS[scale_type]
         enhanced_progression = []
         
         for chord in base_progression:
-            if random.random() > 0.7:  # 30% chance for seventh
+            if (rng or random).random() > 0.7:  # 30% chance for seventh
                 chord = chord + [chord[0] + 10]
             enhanced_progression.append([root_note + note for note in chord])
         
@@ -118,18 +290,19 @@ class ScaleGenerator:
 class MelodyGenerator:
     """Generates melodic phrases and rhythms."""
     
+    RHYTHM_PATTERNS: List[List[float]] = [
+        [1, 0.5, 0.5, 0.5, 0.5],
+        [0.5, 0.5, 1, 0.5, 0.5],
+        [0.25, 0.25, 0.5, 0.5, 0.5]
+    ]
+    PHRASE_PATTERNS: List[List[int]] = [[0, 2, 4, 3], [0, 1, 2, 1], [0, 4, 2, 3]]
+    
     @staticmethod
     def generate_rhythm_pattern(length: int) -> List[float]:
         """Generate dynamic rhythm patterns."""
-        base_patterns = [
-            [1, 0.5, 0.5, 0.5, 0.5],
-            [0.5, 0.5, 1, 0.5, 0.5],
-            [0.25, 0.25, 0.5, 0.5, 0.5]
-        ]
-        
         pattern = []
         while len(pattern) < length:
-            pattern.extend(random.choice(base_patterns))
+            pattern.extend(random.choice(MelodyGenerator.RHYTHM_PATTERNS))
         
         return pattern[:length]
     
@@ -140,209 +313,729 @@ class MelodyGenerator:
         previous_phrase: Optional[List[int]] = None
     ) -> List[int]:
         """Generate an engaging melodic phrase."""
-        phrase = [previous_phrase[-1] if previous_phrase else scale[0]]
-        patterns = [[0, 2, 4, 3], [0, 1, 2, 1], [0, 4, 2, 3]]
-        current_pattern = random.choice(patterns)
+        first_note = previous_phrase[-1] if previous_phrase else scale[0]
+        index = scale.index(first_note) if first_note in scale else 0
+        phrase = [first_note]
+        current_pattern = random.choice(MelodyGenerator.PHRASE_PATTERNS)
         
+        # Track the scale degree instead of searching for the last note
         for i in range(1, length):
-            last_note = phrase[-1]
-            last_index = scale.index(last_note) if last_note in scale else 0
-            
-            if i % 4 == 0:
-                pattern_index = (i // 4) % len(current_pattern)
-                next_index = (last_index + current_pattern[pattern_index]) % len(scale)
-            else:
-                moves = [-2, -1, 1, 2] if i % 2 == 0 else [-1, 0, 1]
-                next_index = (last_index + random.choice(moves)) % len(scale)
-            
-            phrase.append(scale[next_index])
+            index = MelodyGenerator.next_degree(index, i, len(scale), current_pattern)
+            phrase.append(scale[index])
         
         return phrase
+    
+    @staticmethod
+    def next_degree(index: int, i: int, scale_size: int, pattern: List[int],
+                    rng: Optional[random.Random] = None) -> int:
+        """Scale degree of the i-th note of a phrase, given the previous degree."""
+        if i % 4 == 0:
+            return (index + pattern[(i // 4) % len(pattern)]) % scale_size
+        moves = [-2, -1, 1, 2] if i % 2 == 0 else [-1, 0, 1]
+        return (index + (rng or random).choice(moves)) % scale_size
+    
+    @staticmethod
+    def to_table(melody: List[int], rhythm_pattern: List[float]) -> NoteTable:
+        """Lay the phrase out on the rhythm, accenting every fourth note."""
+        durations = np.asarray(rhythm_pattern[:len(melody)], dtype=np.float64)
+        velocities = [random.randint(100, 127) if i % 4 == 0 else random.randint(85, 110)
+                      for i in range(len(durations))]
+        return NoteTable.from_arrays(melody[:len(durations)], np.cumsum(durations) - durations,
+                                     durations, velocities)
 class DrumGenerator:
     """Generates drum patterns."""
     
     def __init__(self, theory: MusicTheory):
         self.theory = theory
     
-    def generate_pattern(self, bars: int) -> List[Tuple[int, float, float]]:
+    def generate_pattern(self, bars: int, velocity: int = 100,
+                         rng: Optional[random.Random] = None) -> NoteTable:
         """Generate a drum pattern for specified number of bars."""
-        pattern = []
-        for bar in range(bars):
-            # Basic drum pattern: kick on 1 and 3, snare on 2 and 4
-            pattern.extend([
-                (self.theory.DRUM_NOTES['kick'], bar + 0.0, 0.25),
-                (self.theory.DRUM_NOTES['closed_hat'], bar + 0.0, 0.25),
-                (self.theory.DRUM_NOTES['snare'], bar + 0.5, 0.25),
-                (self.theory.DRUM_NOTES['closed_hat'], bar + 0.5, 0.25),
-                (self.theory.DRUM_NOTES['kick'], bar + 1.0, 0.25),
-                (self.theory.DRUM_NOTES['closed_hat'], bar + 1.0, 0.25),
-                (self.theory.DRUM_NOTES['snare'], bar + 1.5, 0.25),
-                (self.theory.DRUM_NOTES['closed_hat'], bar + 1.5, 0.25),
-            ])
-            
-            # Occasionally add fills
-            if random.random() > 0.8:
-                pattern.extend([
-                    (self.theory.DRUM_NOTES['snare'], bar + 1.75, 0.125),
-                    (self.theory.DRUM_NOTES['snare'], bar + 1.875, 0.125),
-                ])
+        drums = self.theory.DRUM_NOTES
+        # Basic drum pattern: kick on 1 and 3, snare on 2 and 4
+        beat_notes = [drums['kick'], drums['closed_hat'], drums['snare'], drums['closed_hat'],
+                      drums['kick'], drums['closed_hat'], drums['snare'], drums['closed_hat']]
+        beat_times = [0.0, 0.0, 0.5, 0.5, 1.0, 1.0, 1.5, 1.5]
+        bar_starts = BEATS_PER_BAR * np.arange(bars)
+        beats = NoteTable.from_arrays(
+            np.tile(beat_notes, bars), np.add.outer(bar_starts, beat_times).ravel(),
+            0.25, velocity, channel=DRUM_CHANNEL)
         
-        return pattern
+        # Occasionally add fills
+        fill_bars = bar_starts[[(rng or random).random() > 0.8 for _ in range(bars)]]
+        fills = NoteTable.from_arrays(
+            drums['snare'], np.add.outer(fill_bars, [1.75, 1.875]).ravel(),
+            0.125, velocity, channel=DRUM_CHANNEL)
+        return NoteTable.concat([beats, fills])
 
 class BassGenerator:
     """Generates bass lines based on chord progressions."""
     
-    def generate_bass_line(self, chord_progression: List[List[int]], bars_per_chord: int) -> List[Tuple[int, float, float]]:
+    def generate_bass_line(self, chord_progression: List[List[int]], bars_per_chord: int,
+                           velocity: int = 90) -> NoteTable:
         """Generate a bass line that follows the chord progression."""
-        bass_line = []
-        current_time = 0.0
-        
-        for chord in chord_progression:
-            root_note = chord[0] - 12  # Move root note down one octave
-            
-            for _ in range(bars_per_chord):
-                # Basic walking bass pattern
-                bass_line.extend([
-                    (root_note, current_time, 0.5),
-                    (root_note + 7, current_time + 0.5, 0.5),
-                    (root_note + 12, current_time + 1.0, 0.5),
-                    (root_note + 7, current_time + 1.5, 0.5)
-                ])
-                current_time += 2.0
-        
-        return bass_line
+        # Root note of each bar, moved down one octave
+        roots = np.repeat([chord[0] - 12 for chord in chord_progression], bars_per_chord)
+        # Basic walking bass pattern
+        pitches = np.add.outer(roots, [0, 7, 12, 7]).ravel()
+        starts = np.add.outer(BEATS_PER_BAR * np.arange(len(roots)), [0.0, 0.5, 1.0, 1.5]).ravel()
+        return NoteTable.from_arrays(pitches, starts, 0.5, velocity)
 
 class StringsGenerator:
     """Generates sustained string accompaniment."""
     
-    def generate_pad(self, chord_progression: List[List[int]], bars_per_chord: int) -> List[Tuple[List[int], float, float]]:
+    def generate_pad(self, chord_progression: List[List[int]], bars_per_chord: int,
+                     velocity: int = 70) -> NoteTable:
         """Generate sustained string pads following the chord progression."""
-        pad_notes = []
-        current_time = 0.0
-        
-        for chord in chord_progression:
-            # Add sustaining strings for each chord
-            duration = bars_per_chord * 2.0  # 2 beats per bar
-            pad_notes.append((chord, current_time, duration))
-            current_time += duration
-        
-        return pad_notes
+        duration = bars_per_chord * BEATS_PER_BAR
+        return self.generate_chords(chord_progression, duration, velocity)
+    
+    @staticmethod
+    def generate_chords(chord_progression: List[List[int]], beats_per_chord: float = 2.0,
+                        velocity: int = 80) -> NoteTable:
+        """Hold every note of each chord for beats_per_chord beats."""
+        sizes = [len(chord) for chord in chord_progression]
+        starts = np.repeat(beats_per_chord * np.arange(len(sizes)), sizes)
+        pitches = [note for chord in chord_progression for note in chord]
+        return NoteTable.from_arrays(pitches, starts, beats_per_chord, velocity)
 
 class MIDIComposer:
     """Handles multi-track MIDI file creation and audio conversion."""
     
     def __init__(self, tempo: int = 120):
-        self.midi = MIDIFile(5)  # 5 tracks
-        for track in range(5):
-            self.midi.addTempo(track, 0, tempo)
+        self.tempo = tempo
+        # Program of each channel; every melodic track gets its own channel
+        # so the instruments do not override each other
+        self.programs: Dict[int, int] = {}
+        self.parts: List[NoteTable] = []
+        self._events: Optional[NoteTable] = None
+    
+    @property
+    def events(self) -> NoteTable:
+        """All notes added so far, as one table without duplicates.
+        
+        Patterns that overlap at bar lines can produce the same note twice;
+        like MIDIFile, only one of them is kept.
+        """
+        if self._events is None:
+            self._events = NoteTable.concat(self.parts).unique()
+        return self._events
+    
+    @staticmethod
+    def channel_for(track: int) -> int:
+        """MIDI channel of a melodic track, skipping the drum channel."""
+        return track if track < DRUM_CHANNEL else track + 1
+    
+    def add_part(self, notes: NoteTable, track: int, program: Optional[int] = None):
+        """Add a melodic part on the track's own channel."""
+        channel = self.channel_for(track)
+        if program is not None:
+            self.programs[channel] = program
+        self.parts.append(notes.assign(track, channel))
+        self._events = None
+    
+    def add_events(self, notes: NoteTable):
+        """Add notes that already carry their track and channel."""
+        self.parts.append(notes)
+        self._events = None
     
     def add_melody(self, melody: List[int], rhythm_pattern: List[float], track: int = 0):
         """Add melody with dynamics to specified track."""
-        self.midi.addProgramChange(track, 0, 0, 0)  # Piano
-        melody_time = 0
-        for i, (note, duration) in enumerate(zip(melody, rhythm_pattern)):
-            velocity = random.randint(100, 127) if i % 4 == 0 else random.randint(85, 110)
-            self.midi.addNote(track, 0, note, melody_time, duration, velocity)
-            melody_time += duration
+        self.add_part(MelodyGenerator.to_table(melody, rhythm_pattern), track, program=0)  # Piano
     
     def add_chords(self, progression: List[List[int]], track: int = 1):
         """Add chords to specified track."""
-        self.midi.addProgramChange(track, 0, 0, 48)  # Strings
-        current_time = 0
-        for chord in progression:
-            for note in chord:
-                self.midi.addNote(track, 0, note, current_time, 2.0, 80)
-            current_time += 2.0
-    
-    def add_bass(self, bass_notes: List[Tuple[int, float, float]], track: int = 2):
+        self.add_part(StringsGenerator.generate_chords(progression), track, program=48)  # Strings
+    
+    def add_bass(self, bass_notes: NoteTable, track: int = 2):
         """Add bass line to specified track."""
-        self.midi.addProgramChange(track, 0, 0, 32)  # Acoustic Bass
-        for note, time, duration in bass_notes:
-            self.midi.addNote(track, 0, note, time, duration, 90)
+        self.add_part(bass_notes, track, program=32)  # Acoustic Bass
     
-    def add_strings(self, string_notes: List[Tuple[List[int], float, float]], track: int = 3):
+    def add_strings(self, string_notes: NoteTable, track: int = 3):
         """Add string pads to specified track."""
-        self.midi.addProgramChange(track, 0, 0, 88)  # String Pad
-        for chord, time, duration in string_notes:
-            for note in chord:
-                self.midi.addNote(track, 0, note, time, duration, 70)
+        self.add_part(string_notes, track, program=88)  # String Pad
     
-    def add_drums(self, drum_pattern: List[Tuple[int, float, float]], track: int = 4):
+    def add_drums(self, drum_pattern: NoteTable, track: int = 4):
         """Add drums to specified track (channel 9)."""
-        for note, time, duration in drum_pattern:
-            self.midi.addNote(track, 9, note, time, duration, 100)
+        self.parts.append(drum_pattern.assign(track, DRUM_CHANNEL))
+        self._events = None
+    
+    def beats(self, duration_ms: int) -> float:
+        """Convert a duration in milliseconds to beats at this tempo."""
+        return duration_ms * self.tempo / 60000
+    
+    def to_midi(self, max_beats: Optional[float] = None) -> bytes:
+        """Build the MIDI file in memory, dropping notes after max_beats."""
+        events = self.events
+        if max_beats is not None:
+            events = events.truncate(max_beats)
+        return events.to_midi(self.tempo, self.programs)
+    
+    def render(self, soundfont_path: str, duration_ms: int = 10000,
+               sample_rate: int = 44100) -> AudioSegment:
+        """Render the first duration_ms of the song to 16-bit stereo PCM.
+        
+        Only notes that start before duration_ms are synthesized. The
+        fluidsynth command line reads and writes files, so the MIDI bytes
+        and the raw PCM pass through a temporary directory; no WAV or
+        intermediate MP3 is written.
+        """
+        with span('music.to_midi'):
+            midi_bytes = self.to_midi(max_beats=self.beats(duration_ms))
+        with tempfile.TemporaryDirectory() as tmp:
+            midi_path = os.path.join(tmp, 'song.mid')
+            pcm_path = os.path.join(tmp, 'song.raw')
+            with open(midi_path, 'wb') as file:
+                file.write(midi_bytes)
+            with span('music.fluidsynth', duration_ms=duration_ms):
+                subprocess.run(['fluidsynth', '-ni', '-T', 'raw', '-O', 's16',
+                                '-F', pcm_path, '-r', str(sample_rate),
+                                soundfont_path, midi_path],
+                               check=True, stdout=subprocess.DEVNULL)
+            with open(pcm_path, 'rb') as file:
+                pcm = file.read()
+        audio = AudioSegment(data=pcm, sample_width=2, frame_rate=sample_rate, channels=2)
+        if len(audio) < duration_ms:
+            audio += AudioSegment.silent(duration_ms - len(audio), sample_rate)
+        return audio[:duration_ms]
+    
+    def cache_key(self, soundfont_path: Optional[str], duration_ms: int, settings: str) -> str:
+        """Content key of the rendered audio: MIDI bytes, soundfont and output settings."""
+        midi_bytes = self.to_midi(max_beats=self.beats(duration_ms))
+        soundfont = file_digest(soundfont_path) if soundfont_path else ''
+        return content_key(midi_bytes, soundfont, f"{settings}:{duration_ms}")
     
-    def save_and_convert(self, filename: str, soundfont_path: str, duration_ms: int = 10000):
-        """Save MIDI file and convert to audio formats."""
-        with open(filename+'.mid', 'wb') as file:
-            self.midi.writeFile(file)
+    def save_and_convert(self, filename: str, soundfont_path: str, duration_ms: int = 10000,
+                         audio_format: str = 'mp3', cache: Optional[ContentCache] = None,
+                         renderer: str = 'fluidsynth') -> str:
+        """Render the song and encode it once as 'mp3', 'wav' or 'raw' PCM.
         
-        fs = FluidSynth(soundfont_path)
-        fs.midi_to_audio(filename+'.mid', filename+'.wav')
+        renderer is 'fluidsynth', 'preview' for the built-in PreviewSynth,
+        which needs neither the fluidsynth binary nor the soundfont, or
+        'auto' for fluidsynth if both are there and PreviewSynth otherwise.
+        With a cache, songs already rendered with the same MIDI content,
+        soundfont and settings are copied from it instead.
+        """
+        if renderer == 'auto':
+            renderer = ('fluidsynth' if os.path.exists(soundfont_path) and shutil.which('fluidsynth')
+                        else 'preview')
+            if renderer == 'preview':
+                print(f"No fluidsynth or no soundfont at {soundfont_path}: rendering with PreviewSynth")
+        if renderer == 'preview':
+            render = lambda: PreviewSynth().render(self, duration_ms)
+            soundfont_path = None
+        elif renderer == 'fluidsynth':
+            render = lambda: self.render(soundfont_path, duration_ms)
+        else:
+            raise ValueError(f"Unknown renderer '{renderer}'")
+        key = None
+        if cache is not None:
+            with span('music.cache_key'):
+                key = self.cache_key(soundfont_path, duration_ms, f"{renderer}:44100:{audio_format}")
+        with span('music.save_and_convert', renderer=renderer, format=audio_format):
+            path, _ = render_cached(render, filename, audio_format, cache, key)
+        print(f"Generated: {path}")
+        return path
+
+class SynthWorker:
+    """An in-process FluidSynth that loads the soundfont once and renders many songs.
+    
+    Needs the pyfluidsynth package and the FluidSynth library. Notes are
+    fed to the synthesizer directly, without a MIDI file or a subprocess.
+    """
+    
+    def __init__(self, soundfont_path: str = "FluidR3_GM.sf2", sample_rate: int = 44100):
+        if fluidsynth is None:
+            raise RuntimeError("SynthWorker needs pyfluidsynth and the FluidSynth library")
+        self.soundfont_path = soundfont_path
+        self.sample_rate = sample_rate
+        self.synth = fluidsynth.Synth(samplerate=float(sample_rate))
+        self.sfid = self.synth.sfload(soundfont_path)
+    
+    @traced('music.synth_worker')
+    def render(self, composer: MIDIComposer, duration_ms: int = 10000) -> AudioSegment:
+        """Render the first duration_ms of the song to 16-bit stereo PCM."""
+        synth = self.synth
+        synth.system_reset()
+        # Programs are set per channel; the drum channel keeps its kit
+        for channel, program in composer.programs.items():
+            if channel != DRUM_CHANNEL:
+                synth.program_select(channel, self.sfid, 0, program)
         
-        audio = AudioSegment.from_wav(filename+'.wav')
-        audio.export(filename+'.mp3', format="mp3")
-        os.remove(filename+'.mid')
-        os.remove(filename+'.wav')
-        audio = AudioSegment.from_mp3(filename+'.mp3')
+        samples_per_beat = 60 * self.sample_rate / composer.tempo
+        total = int(duration_ms * self.sample_rate / 1000)
+        notes = composer.events.truncate(total / samples_per_beat)
+        starts = (notes['start'] * samples_per_beat).astype(np.int64)
+        ends = ((notes['start'] + notes['duration']) * samples_per_beat).astype(np.int64)
+        samples = np.minimum(np.concatenate([starts, ends]), total)
+        is_on = np.repeat([True, False], len(notes))
+        order = np.lexsort((is_on, samples))  # note-offs before note-ons at the same sample
+        events = zip(samples[order].tolist(), is_on[order].tolist(),
+                     np.tile(notes['channel'], 2)[order].tolist(),
+                     np.tile(notes['pitch'], 2)[order].tolist(),
+                     np.tile(notes['velocity'], 2)[order].tolist())
         
-        # Cut the audio to specified duration
-        cut_audio = audio[:duration_ms]
+        chunks = []
+        position = 0
+        for sample, is_on, channel, note, velocity in events:
+            if sample > position:
+                chunks.append(synth.get_samples(sample - position))
+                position = sample
+            if is_on:
+                synth.noteon(channel, note, velocity)
+            else:
+                synth.noteoff(channel, note)
+        if total > position:
+            chunks.append(synth.get_samples(total - position))
+        pcm = np.concatenate(chunks).astype(np.int16).tobytes() if chunks else b''
+        return AudioSegment(data=pcm, sample_width=2, frame_rate=self.sample_rate, channels=2)
+
+class PreviewSynth:
+    """A small NumPy synthesizer for drafts: no FluidSynth, no soundfont.
+    
+    Each General MIDI program in MusicTheory.INSTRUMENTS gets an additive
+    voice, a one-period wavetable of a few harmonics under an
+    attack/decay/release envelope, and each drum in DRUM_NOTES a
+    synthesized hit. A waveform is computed once per distinct voice, pitch
+    and length, and all the notes sharing it are added into the mix in
+    one batch, so a song renders far faster than real time.
+    """
+    
+    TABLE_SIZE = 2048
+    # Samples of the mix (onsets x wave length) added in one step
+    MIX_BLOCK = 1 << 16
+    # Drum hits end where they stay below this level, under one 16-bit
+    # step once mixed
+    SILENCE = 1e-4
+    # program: (harmonic amplitudes, attack s, decay s, sustain level, release s)
+    VOICES: Dict[int, Tuple[Tuple[float, ...], float, float, float, float]] = {
+        0: ((1.0, 0.5, 0.25, 0.12, 0.06), 0.005, 0.6, 0.3, 0.15),   # piano
+        48: ((1.0, 0.6, 0.45, 0.3, 0.2, 0.1), 0.08, 0.4, 0.8, 0.3),  # strings
+        32: ((1.0, 0.35, 0.1), 0.01, 0.3, 0.5, 0.08),                # bass
+        88: ((1.0, 0.2, 0.1, 0.05), 0.4, 1.0, 0.9, 0.6),             # pad
+    }
+    DEFAULT_VOICE = VOICES[0]
+    
+    def __init__(self, sample_rate: int = 44100):
+        self.sample_rate = sample_rate
+        self._tables: Dict[int, np.ndarray] = {}
+        self._waves: Dict[Tuple[int, int, int], np.ndarray] = {}
+        self._drums: Dict[int, np.ndarray] = {}
+    
+    def _table(self, program: int) -> np.ndarray:
+        if program not in self._tables:
+            harmonics = self.VOICES.get(program, self.DEFAULT_VOICE)[0]
+            phase = 2 * np.pi * np.arange(self.TABLE_SIZE) / self.TABLE_SIZE
+            table = sum(a * np.sin((h + 1) * phase) for h, a in enumerate(harmonics))
+            self._tables[program] = (table / np.abs(table).max()).astype(np.float32)
+        return self._tables[program]
+    
+    def _wave(self, program: int, pitch: int, length: int) -> np.ndarray:
+        """Waveform of one note held for length samples, including its release."""
+        key = (program, pitch, length)
+        if key not in self._waves:
+            _, attack, decay, sustain, release = self.VOICES.get(program, self.DEFAULT_VOICE)
+            rate = self.sample_rate
+            total = length + int(release * rate)
+            # Sample numbers in float64 keep the phase exact on long notes
+            n = np.arange(total, dtype=np.float64)
+            t = n / rate
+            frequency = 440.0 * 2 ** ((pitch - 69) / 12)
+            index = (n * (frequency * self.TABLE_SIZE / rate)).astype(np.int64) % self.TABLE_SIZE
+            envelope = np.minimum(t / attack, 1.0)
+            envelope *= sustain + (1 - sustain) * np.exp(-t / decay)
+            held = length / rate
+            envelope[length:] *= np.exp(-(t[length:] - held) * (5 / release))
+            self._waves[key] = (self._table(program)[index] * envelope).astype(np.float32)
+        return self._waves[key]
+    
+    def _drum(self, note: int) -> np.ndarray:
+        if note not in self._drums:
+            rate = self.sample_rate
+            drums = MusicTheory.DRUM_NOTES
+            # Fixed noise, so previews are reproducible
+            noise = np.random.default_rng(note).uniform(-1, 1, rate).astype(np.float32)
+            t = np.arange(rate) / rate
+            if note == drums['kick']:
+                # Sine sweeping down from 150 Hz to 50 Hz
+                phase = 2 * np.pi * (50 * t + 100 * 0.04 * (1 - np.exp(-t / 0.04)))
+                hit = np.sin(phase) * np.exp(-t / 0.15)
+            elif note == drums['snare']:
+                hit = (0.6 * noise + 0.4 * np.sin(2 * np.pi * 180 * t)) * np.exp(-t / 0.08)
+            else:
+                # Cymbals: high-passed noise, longer for open hat, crash and ride
+                decay = 0.04 if note == drums['closed_hat'] else 0.3
+                hit = np.diff(noise, prepend=0) * 0.5 * np.exp(-t / decay)
+            audible = np.flatnonzero(np.abs(hit) > self.SILENCE)
+            self._drums[note] = hit[:audible[-1] + 1 if len(audible) else 1].astype(np.float32)
+        return self._drums[note]
+    
+    def _mix(self, mix: np.ndarray, wave: np.ndarray, starts: np.ndarray, gains: np.ndarray):
+        """Add gain * wave into mix at every start.
+        
+        The onsets are dealt into k layers, k being the most onsets within
+        one wave length, so that no two notes of a layer overlap. Each
+        layer is then added in one step, through a view of the mix with a
+        row of wave length at every sample.
+        """
+        order = np.argsort(starts, kind='stable')
+        starts, gains = starts[order], gains[order]
+        # Notes running past the end are cut to fit
+        fits = starts + len(wave) <= len(mix)
+        for start, gain in zip(starts[~fits].tolist(), gains[~fits].tolist()):
+            mix[start:] += gain * wave[:len(mix) - start]
+        starts, gains = starts[fits], gains[fits]
+        if not len(starts):
+            return
+        layers = int((np.searchsorted(starts, starts + len(wave)) - np.arange(len(starts))).max())
+        rows = np.lib.stride_tricks.sliding_window_view(mix, len(wave), writeable=True)
+        block = max(1, self.MIX_BLOCK // len(wave))
+        for layer in range(layers):
+            layer_starts, layer_gains = starts[layer::layers], gains[layer::layers]
+            for i in range(0, len(layer_starts), block):
+                rows[layer_starts[i:i + block]] += layer_gains[i:i + block, None] * wave
+    
+    @traced('music.preview_synth')
+    def render(self, composer: 'MIDIComposer', duration_ms: int = 10000) -> AudioSegment:
+        """Render the first duration_ms of the song to 16-bit stereo PCM."""
+        samples_per_beat = 60 * self.sample_rate / composer.tempo
+        total = int(duration_ms * self.sample_rate / 1000)
+        return self.render_notes(composer.events, composer.programs, samples_per_beat, total)
+    
+    def render_notes(self, notes: NoteTable, programs: Dict[int, int],
+                     samples_per_beat: float, total: int) -> AudioSegment:
+        """Render the first total samples of a note table to 16-bit stereo PCM.
         
-        # Export the cut audio
-        cut_audio.export(filename+'.mp3', format="mp3")
-        print(f"Generated: {filename}'.mp3")
+        programs maps channels to General MIDI programs (0 if missing).
+        """
+        notes = notes.truncate(total / samples_per_beat)
+        starts = (notes['start'] * samples_per_beat).astype(np.int64)
+        lengths = np.maximum((notes['duration'] * samples_per_beat).astype(np.int64), 1)
+        gains = notes['velocity'].astype(np.float32) / 127 * 0.25
+        programs = np.array([programs.get(channel, 0) for channel in range(16)])
+        voices = programs[notes['channel']]
+        
+        mix = np.zeros(total, dtype=np.float32)
+        # Group the notes by waveform: (program, pitch, length), with
+        # program -1 and length 0 for drums
+        drum = notes['channel'] == DRUM_CHANNEL
+        keys = np.stack([np.where(drum, -1, voices), notes['pitch'].astype(np.int64),
+                         np.where(drum, 0, lengths)], axis=1)
+        keys, group = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(group.ravel(), kind='stable')
+        bounds = np.searchsorted(group.ravel()[order], np.arange(len(keys) + 1))
+        with span('music.preview_mix', notes=len(notes), waveforms=len(keys)):
+            for (program, pitch, length), lo, hi in zip(keys.tolist(), bounds[:-1], bounds[1:]):
+                wave = self._drum(pitch) if program < 0 else self._wave(program, pitch, length)
+                members = order[lo:hi]
+                self._mix(mix, wave, starts[members], gains[members])
+        
+        # Soft clipping keeps dense passages from wrapping around
+        pcm = (np.tanh(mix) * 32000).astype(np.int16)
+        return AudioSegment(data=np.repeat(pcm, 2).tobytes(), sample_width=2,
+                            frame_rate=self.sample_rate, channels=2)
+
+def audio_extension(audio_format: str) -> str:
+    return '.pcm' if audio_format == 'raw' else '.' + audio_format
+
+def export_audio(audio: AudioSegment, filename: str, audio_format: str = 'mp3') -> str:
+    """Encode audio to filename plus the format's extension."""
+    path = filename + audio_extension(audio_format)
+    with span('music.export', format=audio_format):
+        if audio_format == 'raw':
+            with open(path, 'wb') as file:
+                file.write(audio.raw_data)
+        else:
+            audio.export(path, format=audio_format)
+    count_file('audio_bytes_written', path)
+    return path
+
+def render_cached(render, filename: str, audio_format: str,
+                  cache: Optional[ContentCache] = None, key: Optional[str] = None) -> Tuple[str, bool]:
+    """Export render() to filename unless the cache has key; returns (path, cache hit)."""
+    suffix = audio_extension(audio_format)
+    if cache is not None:
+        cached = cache.open(key, suffix)
+        if cached is not None:
+            with cached, open(filename + suffix, 'wb') as f:
+                shutil.copyfileobj(cached, f)
+            return filename + suffix, True
+    path = export_audio(render(), filename, audio_format)
+    if cache is not None:
+        cache.put_file(key, path, suffix)
+    return path, False
 
-def get_tempo_for_mood(theory: MusicTheory, mood: str) -> int:
+def get_tempo_for_mood(theory: MusicTheory, mood: str,
+                       rng: Optional[random.Random] = None) -> int:
     """Get an appropriate tempo based on the mood."""
     if mood.lower() in theory.MOOD_TEMPOS:
         min_tempo, max_tempo = theory.MOOD_TEMPOS[mood.lower()]
-        return random.randint(min_tempo, max_tempo)
+        return (rng or random).randint(min_tempo, max_tempo)
     return 120  # Default tempo if mood not found
 
-def create_multi_track_song(mood: str = 'happy', soundfont_path: str = "FluidR3_GM.sf2"):
-    """Create a complete song with multiple instrument tracks."""
-    # Initialize components
-    theory = MusicTheory()
-    scale_gen = ScaleGenerator(theory)
-    scale, chord_progression = scale_gen.get_scale_for_mood(mood)
+class SongStream:
+    """Composes a song bar by bar, for as long as it is iterated.
+    
+    Each bar comes out as one NoteTable holding every part, already placed
+    on its track and channel, and the parts follow the same chord: each
+    chord lasts bars_per_chord bars and the progression repeats. Only the
+    current bar and a few numbers of melody state are held, so memory does
+    not grow with the length of the song. Choices are drawn from a private
+    generator seeded with seed, so iterating again gives the same song.
+    """
     
-    # Double the chord progression for longer song
-    chord_progression = chord_progression + chord_progression
+    TRACKS: Dict[str, int] = {'melody': 0, 'chords': 1, 'bass': 2, 'pad': 3, 'drums': 4}
     
-    # Get mood-appropriate tempo
-    tempo = get_tempo_for_mood(theory, mood)
-    print(f"Selected tempo for {mood} mood: {tempo} BPM")
+    def __init__(self, mood: str = 'happy', seed: Optional[int] = None, bars_per_chord: int = 2):
+        rng = random.Random(seed)
+        self.theory = MusicTheory()
+        self.bars_per_chord = bars_per_chord
+        self.scale, self.progression = ScaleGenerator(self.theory).get_scale_for_mood(mood, rng)
+        self.tempo = get_tempo_for_mood(self.theory, mood, rng)
+        self.with_strings = mood.lower() in self.theory.MOOD_WITH_STRINGS
+        self.programs = {MIDIComposer.channel_for(self.TRACKS['melody']): self.theory.INSTRUMENTS['piano'],
+                         MIDIComposer.channel_for(self.TRACKS['bass']): self.theory.INSTRUMENTS['bass']}
+        if self.with_strings:
+            self.programs[MIDIComposer.channel_for(self.TRACKS['chords'])] = self.theory.INSTRUMENTS['strings']
+            self.programs[MIDIComposer.channel_for(self.TRACKS['pad'])] = self.theory.INSTRUMENTS['pad']
+        self._seed = rng.random()
     
-    # Generate all parts
-    melody_gen = MelodyGenerator()
-    melody = melody_gen.generate_melodic_phrase(scale, length=64)
-    rhythm = melody_gen.generate_rhythm_pattern(len(melody))
+    @property
+    def phrase_bars(self) -> int:
+        """Bars in one pass through the progression; the melody starts a new phrase after each."""
+        return len(self.progression) * self.bars_per_chord
     
-    bass_gen = BassGenerator()
-    bass_line = bass_gen.generate_bass_line(chord_progression, bars_per_chord=2)
+    def bars_for(self, duration_ms: int) -> int:
+        """Number of bars needed to fill duration_ms at this tempo."""
+        return int(np.ceil(duration_ms * self.tempo / 60000 / BEATS_PER_BAR))
     
-    # Generate strings only for sad/gloomy moods
-    strings_gen = StringsGenerator()
-    string_pads = strings_gen.generate_pad(chord_progression, bars_per_chord=2)
+    def _melody(self, rng: random.Random) -> Iterator[Tuple[List[int], List[float]]]:
+        # Pitches and durations of each bar; rhythm cells are cut at bar lines
+        scale = self.scale
+        index = 0
+        cell: List[float] = []
+        bar = 0
+        while True:
+            if bar % self.phrase_bars == 0:
+                pattern = rng.choice(MelodyGenerator.PHRASE_PATTERNS)
+                i = 0
+            pitches, durations = [], []
+            filled = 0.0
+            while filled < BEATS_PER_BAR:
+                if not cell:
+                    cell = list(rng.choice(MelodyGenerator.RHYTHM_PATTERNS))
+                duration = min(cell.pop(0), BEATS_PER_BAR - filled)
+                if i:
+                    index = MelodyGenerator.next_degree(index, i, len(scale), pattern, rng)
+                pitches.append(scale[index])
+                durations.append(duration)
+                filled += duration
+                i += 1
+            yield pitches, durations
+            bar += 1
+    
+    def final_bar(self, bar: int) -> NoteTable:
+        """A closing bar: the tonic chord in every part, with a crash.
+        
+        The notes stop a quarter of the bar early so they can ring out
+        before the song ends.
+        """
+        tonic = self.progression[0]
+        length = 0.75 * BEATS_PER_BAR
+        channel = MIDIComposer.channel_for
+        tracks = self.TRACKS
+        parts = [NoteTable.from_arrays(self.scale[0], 0.0, length, 100,
+                                       channel(tracks['melody']), tracks['melody']),
+                 NoteTable.from_arrays(tonic[0] - 12, 0.0, length, 90,
+                                       channel(tracks['bass']), tracks['bass'])]
+        if self.with_strings:
+            for name, velocity in (('chords', 80), ('pad', 70)):
+                parts.append(NoteTable.from_arrays(tonic, 0.0, length, velocity,
+                                                   channel(tracks[name]), tracks[name]))
+        drums = self.theory.DRUM_NOTES
+        parts.append(NoteTable.from_arrays([drums['kick'], drums['crash']], 0.0, length, 100,
+                                           DRUM_CHANNEL, tracks['drums']))
+        return NoteTable.concat(parts).shift(bar * BEATS_PER_BAR)
     
-    drum_gen = DrumGenerator(theory)
-    drum_pattern = drum_gen.generate_pattern(bars=len(chord_progression) * 3)
+    def bars(self, count: Optional[int] = None, ending: bool = False) -> Iterator[NoteTable]:
+        """Yield the notes of each bar, forever or for count bars.
+        
+        With ending, the last of the count bars is a final_bar.
+        """
+        rng = random.Random(self._seed)
+        melody = self._melody(rng)
+        drums = DrumGenerator(self.theory)
+        bass = BassGenerator()
+        strings = StringsGenerator()
+        channel = MIDIComposer.channel_for
+        tracks = self.TRACKS
+        bar = 0
+        while count is None or bar < count:
+            if ending and bar == count - 1:
+                yield self.final_bar(bar)
+                return
+            start = bar * BEATS_PER_BAR
+            chord = self.progression[(bar // self.bars_per_chord) % len(self.progression)]
+            
+            pitches, durations = next(melody)
+            durations = np.asarray(durations)
+            offsets = np.cumsum(durations) - durations
+            velocities = [rng.randint(100, 127) if offset == 0 else rng.randint(85, 110)
+                          for offset in offsets]
+            parts = [NoteTable.from_arrays(pitches, offsets, durations, velocities).assign(
+                tracks['melody'], channel(tracks['melody']))]
+            parts.append(bass.generate_bass_line([chord], 1).assign(
+                tracks['bass'], channel(tracks['bass'])))
+            if self.with_strings:
+                parts.append(strings.generate_chords([chord], BEATS_PER_BAR).assign(
+                    tracks['chords'], channel(tracks['chords'])))
+                if bar % self.bars_per_chord == 0:
+                    parts.append(strings.generate_pad([chord], self.bars_per_chord).assign(
+                        tracks['pad'], channel(tracks['pad'])))
+            parts.append(drums.generate_pattern(1, rng=rng).assign(tracks['drums'], DRUM_CHANNEL))
+            
+            yield NoteTable.concat(parts).shift(start)
+            bar += 1
     
-    # Create MIDI file with all tracks
-    composer = MIDIComposer(tempo=tempo)
-    composer.add_melody(melody, rhythm, track=0)
+    def fit(self, duration_ms: int) -> int:
+        """Adjust the tempo so a whole number of bars lasts duration_ms; returns the bars."""
+        bars = max(1, round(duration_ms * self.tempo / 60000 / BEATS_PER_BAR))
+        self.tempo = bars * BEATS_PER_BAR * 60000 / duration_ms
+        return bars
     
-    # Add strings only for specific moods
-    if mood.lower() in theory.MOOD_WITH_STRINGS:
-        composer.add_chords(chord_progression, track=1)
-        composer.add_strings(string_pads, track=3)
+    def to_composer(self, bars: int, ending: bool = False) -> 'MIDIComposer':
+        """Collect the first bars of the song into a MIDIComposer."""
+        composer = MIDIComposer(tempo=self.tempo)
+        composer.programs.update(self.programs)
+        composer.add_events(NoteTable.concat(list(self.bars(bars, ending))))
+        return composer
+
+def compose_song(mood: str = 'happy', seed: Optional[int] = None,
+                 duration_ms: Optional[int] = None) -> 'MIDIComposer':
+    """Compose a song with multiple instrument tracks.
+    
+    The song is long enough to cover duration_ms, or two passes through
+    the chord progression by default. The same mood and seed always give
+    the same song.
+    """
+    stream = SongStream(mood, seed)
+    print(f"Selected tempo for {mood} mood: {stream.tempo} BPM")
+    if stream.with_strings:
         print(f"Added string sections for {mood} mood")
+    bars = stream.bars_for(duration_ms) if duration_ms else 2 * stream.phrase_bars
+    return stream.to_composer(bars)
+
+def create_multi_track_song(mood: str = 'happy', soundfont_path: str = "FluidR3_GM.sf2",
+                            seed: Optional[int] = None, duration_ms: int = 10000,
+                            renderer: str = 'fluidsynth'):
+    """Create a complete song with multiple instrument tracks."""
+    composer = compose_song(mood, seed, duration_ms)
+    composer.save_and_convert('output', soundfont_path, duration_ms, renderer=renderer)
+
+def compose_soundtrack(mood: str, duration_ms: int, seed: Optional[int] = None) -> 'MIDIComposer':
+    """Compose a song lasting exactly duration_ms that ends on a final tonic bar.
+    
+    The mood's tempo is nudged so that a whole number of bars fits.
+    """
+    stream = SongStream(mood, seed)
+    bars = stream.fit(duration_ms)
+    print(f"Soundtrack for {mood} mood: {bars} bars at {stream.tempo:.1f} BPM")
+    return stream.to_composer(bars, ending=True)
+
+def create_soundtrack(duration_ms: int, filename: str = 'soundtrack', mood: str = 'happy',
+                      soundfont_path: str = "FluidR3_GM.sf2", seed: Optional[int] = None,
+                      audio_format: str = 'wav', renderer: str = 'fluidsynth',
+                      cache: Optional[ContentCache] = None) -> str:
+    """Render a soundtrack of exactly duration_ms; returns the audio file's path."""
+    composer = compose_soundtrack(mood, duration_ms, seed)
+    return composer.save_and_convert(filename, soundfont_path, duration_ms, audio_format,
+                                     cache, renderer)
+
+@dataclass
+class SongJob:
+    """One song to compose and render in a SynthPool."""
+    mood: str
+    seed: int
+    filename: str
+    duration_ms: int = 10000
+    audio_format: str = 'mp3'
+
+# Synthesizer and render cache of the current SynthPool worker process
+_synth_worker: Optional['SynthWorker'] = None
+_song_cache: Optional[ContentCache] = None
+
+def _init_synth_worker(soundfont_path: str, sample_rate: int,
+                       cache_dir: Optional[str], cache_max_bytes: int):
+    global _synth_worker, _song_cache
+    _synth_worker = SynthWorker(soundfont_path, sample_rate)
+    _song_cache = ContentCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+def _render_song_job(job: SongJob) -> Tuple[str, bool]:
+    composer = compose_song(job.mood, job.seed, job.duration_ms)
+    key = None
+    if _song_cache is not None:
+        key = composer.cache_key(_synth_worker.soundfont_path, job.duration_ms,
+                                 f"synthworker:{_synth_worker.sample_rate}:{job.audio_format}")
+    return render_cached(lambda: _synth_worker.render(composer, job.duration_ms),
+                         job.filename, job.audio_format, _song_cache, key)
+
+class SynthPool:
+    """Worker processes that load the soundfont once and take render jobs from a queue."""
+    
+    def __init__(self, soundfont_path: str = "FluidR3_GM.sf2", workers: Optional[int] = None,
+                 sample_rate: int = 44100, cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = 2 << 30):
+        self.pool = multiprocessing.Pool(
+            workers, initializer=_init_synth_worker,
+            initargs=(soundfont_path, sample_rate, cache_dir, cache_max_bytes))
+    
+    def render(self, jobs: List[SongJob]):
+        """Yield (output path, cache hit) for each job as it finishes."""
+        return self.pool.imap_unordered(_render_song_job, jobs)
+    
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def create_multi_track_songs(moods: List[str], songs_per_mood: int = 1,
+                             soundfont_path: str = "FluidR3_GM.sf2", output_dir: str = 'songs',
+                             duration_ms: int = 10000, base_seed: int = 0,
+                             workers: Optional[int] = None, audio_format: str = 'mp3',
+                             cache_dir: Optional[str] = None) -> List[str]:
+    """Generate songs for several moods in parallel.
+    
+    The n-th job uses seed base_seed + n, so a batch can be re-run or
+    extended and every song comes out the same whichever worker renders it.
+    With cache_dir, songs whose content was rendered before are reused.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for mood in moods:
+        for _ in range(songs_per_mood):
+            seed = base_seed + len(jobs)
+            filename = os.path.join(output_dir, f"{mood}_{seed}")
+            jobs.append(SongJob(mood, seed, filename, duration_ms, audio_format))
     
-    composer.add_bass(bass_line, track=2)
-    composer.add_drums(drum_pattern, track=4)
+    start = time.perf_counter()
+    paths = []
+    hits = 0
+    with SynthPool(soundfont_path, workers, cache_dir=cache_dir) as pool:
+        for path, hit in pool.render(jobs):
+            paths.append(path)
+            hits += hit
+    elapsed = time.perf_counter() - start
     
-    composer.save_and_convert('output', soundfont_path)
+    rate = len(paths) / elapsed * 60 if elapsed else 0.0
+    print(f"Generated {len(paths)} songs in {elapsed:.1f}s ({rate:.1f} songs/min)")
+    if cache_dir:
+        print(f"Render cache: {hits} hits, {len(paths) - hits} misses")
+    return paths
 
 if __name__ == "__main__":
     create_multi_track_song(mood="energetic")
\ No newline at end of file
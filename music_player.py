@@ -0,0 +1,321 @@
+"""Real-time playback of generated music.
+
+RealtimePlayer pulls bars from a SongStream a little ahead of the playback
+position and sends each note to a sink at its time, so a mood or tempo can
+be previewed immediately instead of after a full render. Sinks:
+
+    NullSink       discards the notes (for tests and benchmarks)
+    WavSink        renders with FluidSynth into a WAV file, at the
+                   scheduled times, so its output is deterministic
+    PreviewWavSink renders with the built-in PreviewSynth into a WAV
+                   file, without FluidSynth or a soundfont
+    FluidSynthSink plays through FluidSynth's audio driver
+    MidiOutSink    sends to a MIDI output port with pygame.midi
+"""
+import asyncio
+import heapq
+import wave
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from music import NoteTable, PreviewSynth, SongStream, BEATS_PER_BAR, fluidsynth
+
+
+class NullSink:
+    """Accepts notes and does nothing with them."""
+
+    def start(self):
+        pass
+
+    def program(self, channel: int, program: int):
+        pass
+
+    def send(self, when: float, is_on: bool, channel: int, pitch: int, velocity: int):
+        pass
+
+    def stop(self, when: float):
+        pass
+
+
+class FluidSynthSink(NullSink):
+    """Plays notes through an in-process FluidSynth and its audio driver."""
+
+    def __init__(self, soundfont_path: str = "FluidR3_GM.sf2", driver: Optional[str] = None,
+                 sample_rate: int = 44100):
+        if fluidsynth is None:
+            raise RuntimeError("FluidSynthSink needs pyfluidsynth and the FluidSynth library")
+        self.soundfont_path = soundfont_path
+        self.driver = driver
+        self.sample_rate = sample_rate
+        self.synth = None
+
+    def _load(self):
+        self.synth = fluidsynth.Synth(samplerate=float(self.sample_rate))
+        self.sfid = self.synth.sfload(self.soundfont_path)
+
+    def start(self):
+        self._load()
+        self.synth.start(driver=self.driver)
+
+    def program(self, channel: int, program: int):
+        self.synth.program_select(channel, self.sfid, 0, program)
+
+    def send(self, when: float, is_on: bool, channel: int, pitch: int, velocity: int):
+        if is_on:
+            self.synth.noteon(channel, pitch, velocity)
+        else:
+            self.synth.noteoff(channel, pitch)
+
+    def stop(self, when: float):
+        self.synth.delete()
+        self.synth = None
+
+
+class WavSink(FluidSynthSink):
+    """Renders notes into a 16-bit stereo WAV file as they arrive.
+
+    Audio is synthesized up to each note's scheduled time before the note
+    is applied, and written out in pieces, so memory does not grow with
+    the length of the recording.
+    """
+
+    def __init__(self, path: str, soundfont_path: str = "FluidR3_GM.sf2",
+                 sample_rate: int = 44100):
+        super().__init__(soundfont_path, sample_rate=sample_rate)
+        self.path = path
+        self.position = 0
+
+    def _render_until(self, when: float):
+        sample = int(when * self.sample_rate)
+        if sample > self.position:
+            samples = self.synth.get_samples(sample - self.position)
+            self.wav.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+            self.position = sample
+
+    def start(self):
+        self._load()
+        self.wav = wave.open(self.path, 'wb')
+        self.wav.setnchannels(2)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(self.sample_rate)
+        self.position = 0
+
+    def send(self, when: float, is_on: bool, channel: int, pitch: int, velocity: int):
+        self._render_until(when)
+        super().send(when, is_on, channel, pitch, velocity)
+
+    def stop(self, when: float):
+        self._render_until(when)
+        self.wav.close()
+        super().stop(when)
+
+
+class PreviewWavSink(NullSink):
+    """Renders notes with PreviewSynth into a 16-bit stereo WAV file.
+
+    Notes are collected at their scheduled times and the file is rendered
+    when playback stops, so its output is deterministic too. A channel
+    plays with the last program set on it.
+    """
+
+    def __init__(self, path: str, sample_rate: int = 44100):
+        self.path = path
+        self.sample_rate = sample_rate
+
+    def start(self):
+        self.programs: Dict[int, int] = {}
+        self.sounding: Dict[tuple, List[tuple]] = {}
+        self.notes: List[tuple] = []
+
+    def program(self, channel: int, program: int):
+        self.programs[channel] = program
+
+    def send(self, when: float, is_on: bool, channel: int, pitch: int, velocity: int):
+        onsets = self.sounding.setdefault((channel, pitch), [])
+        if is_on:
+            onsets.append((when, velocity))
+        elif onsets:
+            start, velocity = onsets.pop(0)
+            self.notes.append((pitch, start, when - start, velocity, channel))
+
+    def stop(self, when: float):
+        for (channel, pitch), onsets in self.sounding.items():
+            for start, velocity in onsets:
+                self.notes.append((pitch, start, when - start, velocity, channel))
+        notes = NoteTable.from_arrays(*zip(*self.notes)) if self.notes else NoteTable()
+        # Note times are in seconds: one "beat" per second
+        audio = PreviewSynth(self.sample_rate).render_notes(
+            notes, self.programs, self.sample_rate, int(when * self.sample_rate))
+        audio.export(self.path, format='wav')
+
+
+class MidiOutSink(NullSink):
+    """Sends notes to a MIDI output port, the default one if device_id is None."""
+
+    def __init__(self, device_id: Optional[int] = None):
+        self.device_id = device_id
+        self.output = None
+
+    def start(self):
+        import pygame.midi
+        pygame.midi.init()
+        device_id = self.device_id
+        if device_id is None:
+            device_id = pygame.midi.get_default_output_id()
+        self.output = pygame.midi.Output(device_id)
+
+    def program(self, channel: int, program: int):
+        self.output.set_instrument(program, channel)
+
+    def send(self, when: float, is_on: bool, channel: int, pitch: int, velocity: int):
+        if is_on:
+            self.output.note_on(pitch, velocity, channel)
+        else:
+            self.output.note_off(pitch, 0, channel)
+
+    def stop(self, when: float):
+        import pygame.midi
+        self.output.close()
+        self.output = None
+        pygame.midi.quit()
+
+
+@dataclass
+class PlaybackStats:
+    """Timing of one playback.
+
+    latencies holds, for every note sent, how late it was sent relative to
+    its scheduled time. An underrun is a bar that was still being
+    generated when it should already have started playing.
+    """
+    latencies: List[float] = field(default_factory=list)
+    underruns: int = 0
+    bars: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        latencies = np.array(self.latencies) * 1000
+        if not len(latencies):
+            latencies = np.zeros(1)
+        return {
+            'events': len(self.latencies),
+            'bars': self.bars,
+            'underruns': self.underruns,
+            'latency_mean_ms': float(latencies.mean()),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+            'latency_max_ms': float(latencies.max()),
+        }
+
+
+class RealtimePlayer:
+    """Plays a SongStream through a sink on an asyncio event loop.
+
+    Bars are generated as soon as playback comes within lookahead seconds
+    of them, and their notes wait in a queue ordered by time until they
+    are due. With realtime=False notes are sent as fast as possible, which
+    renders a WavSink faster than real time.
+    """
+
+    def __init__(self, stream: SongStream, sink: Optional[NullSink] = None,
+                 lookahead: float = 0.1, realtime: bool = True):
+        self.stream = stream
+        self.sink = sink or NullSink()
+        self.lookahead = lookahead
+        self.realtime = realtime
+        self.stats = PlaybackStats()
+        self._next_stream: Optional[SongStream] = None
+        self._stopping = False
+        self._bars = None
+        self._bar_index = 0
+        self._seconds_per_beat = 60 / stream.tempo
+
+    def switch(self, stream: SongStream):
+        """Continue with another stream, for example a new mood, from the next bar."""
+        self._next_stream = stream
+
+    def stop(self):
+        """Stop after the notes that are already due."""
+        self._stopping = True
+
+    def _start_stream(self, stream: SongStream):
+        self.stream = stream
+        for channel, program in stream.programs.items():
+            self.sink.program(channel, program)
+        self._bars = stream.bars()
+        self._bar_index = 0
+        self._seconds_per_beat = 60 / stream.tempo
+
+    def _queue_bar(self, queue: list, origin: float):
+        # Times in the bar table count from the start of its stream
+        bar = next(self._bars).events
+        beats = bar['start'] - self._bar_index * BEATS_PER_BAR
+        starts = origin + beats * self._seconds_per_beat
+        ends = starts + bar['duration'] * self._seconds_per_beat
+        for start, end, channel, pitch, velocity in zip(
+                starts.tolist(), ends.tolist(), bar['channel'].tolist(),
+                bar['pitch'].tolist(), bar['velocity'].tolist()):
+            # Note-offs sort before note-ons at the same time
+            heapq.heappush(queue, (start, 1, channel, pitch, velocity))
+            heapq.heappush(queue, (end, 0, channel, pitch, 0))
+        self._bar_index += 1
+        return BEATS_PER_BAR * self._seconds_per_beat
+
+    async def play(self, bars: Optional[int] = None) -> PlaybackStats:
+        """Play bars bars, or until stop() is called; returns the timing stats."""
+        loop = asyncio.get_running_loop()
+        self.stats = PlaybackStats()
+        self._stopping = False
+        queue: list = []
+        bar_time = 0.0  # start of the next bar, in seconds from the start of playback
+        now = 0.0
+        self.sink.start()
+        self._start_stream(self.stream)
+        started = loop.time() + self.lookahead
+        try:
+            while not self._stopping:
+                if self.realtime:
+                    now = loop.time() - started
+                if (bars is None or self.stats.bars < bars) and bar_time <= now + self.lookahead:
+                    if self._next_stream is not None:
+                        self._start_stream(self._next_stream)
+                        self._next_stream = None
+                    if bar_time < now:
+                        self.stats.underruns += 1
+                    bar_time += self._queue_bar(queue, bar_time)
+                    self.stats.bars += 1
+                    continue
+                if not queue:
+                    break
+                if queue[0][0] > now:
+                    if not self.realtime:
+                        now = queue[0][0]
+                        continue
+                    due = queue[0][0]
+                    if bars is None or self.stats.bars < bars:
+                        # Wake up in time to generate the next bar
+                        due = min(due, bar_time - self.lookahead)
+                    await asyncio.sleep(max(due - now, 0))
+                    continue
+                when, is_on, channel, pitch, velocity = heapq.heappop(queue)
+                self.sink.send(when, bool(is_on), channel, pitch, velocity)
+                self.stats.latencies.append(now - when if self.realtime else 0.0)
+        finally:
+            # Release notes that are still sounding
+            for when, is_on, channel, pitch, _ in sorted(queue):
+                if not is_on:
+                    self.sink.send(max(now, 0.0), False, channel, pitch, 0)
+            self.sink.stop(max(now, 0.0))
+        return self.stats
+
+
+def preview(mood: str = 'happy', seed: Optional[int] = None, bars: int = 8,
+            sink: Optional[NullSink] = None, lookahead: float = 0.1) -> Dict[str, float]:
+    """Play a few bars of a mood and return the timing summary."""
+    player = RealtimePlayer(SongStream(mood, seed), sink, lookahead)
+    return asyncio.run(player.play(bars)).summary()
+
+
+if __name__ == "__main__":
+    for mood in ['happy', 'sad', 'energetic']:
+        print(mood, preview(mood, seed=0))
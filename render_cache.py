@@ -0,0 +1,137 @@
+"""Content-addressed on-disk cache for rendered files."""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+
+# Temporary files older than this are left over from crashed writers
+STALE_TEMP_SECONDS = 3600
+
+
+def content_key(*parts):
+    """SHA-256 key over the given bytes or str parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _file_digest(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """Hash of a file's contents, computed once per process per version."""
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class ContentCache:
+    """A size-bounded LRU cache of files named by their content key.
+
+    Entries are written to a temporary file in the cache directory and
+    renamed into place, so processes sharing the directory never see a
+    partial entry. A file's modification time records when it was last
+    used and is refreshed on every hit; once the directory grows past
+    max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=2 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, suffix=''):
+        return os.path.join(self.directory, key + suffix)
+
+    def open(self, key, suffix=''):
+        """The cached entry opened for binary reading, or None on a miss.
+
+        Another process may evict the entry at any time; an open file
+        stays readable, where a path could be gone before it is used.
+        """
+        path = self.path(key, suffix)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted since it was opened
+            pass
+        self.hits += 1
+        return f
+
+    def _commit(self, write, key, suffix):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, self.path(key, suffix))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        # The new entry stays even if it alone is larger than max_bytes,
+        # so the returned path exists
+        self.evict(keep=self.path(key, suffix))
+        return self.path(key, suffix)
+
+    def put(self, key, data, suffix=''):
+        """Store bytes under key and return the entry's path."""
+        return self._commit(lambda f: f.write(data), key, suffix)
+
+    def put_file(self, key, source_path, suffix=''):
+        """Store a copy of an existing file under key."""
+        def write(f):
+            with open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        return self._commit(write, key, suffix)
+
+    def evict(self, keep=None):
+        """Delete least recently used entries, except keep, until under max_bytes."""
+        entries = []
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                        self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # already evicted by another process
+            pass
+        except PermissionError:  # open in another process, on Windows
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,339 @@
+"""Run the scripts as steps of a build described by a manifest.
+
+manifest.json lists every step with the script it runs, the files it
+reads and the files it writes:
+
+    "slideshow": {
+      "script": "6-videoslide.py",
+      "function": "create_slideshow",
+      "args": [["basic_shapes.png", "text_overlay.png", "enhanced.jpg"]],
+      "kwargs": {"output_path": "slideshow.mp4"},
+      "inputs": ["basic_shapes.png", "text_overlay.png", "enhanced.jpg"],
+      "outputs": ["slideshow.mp4"]
+    }
+
+Files listed in optional_inputs are read when they exist, such as the
+soundfont of the music step, which renders with a built-in synthesizer
+without one. Unlike a missing input, a missing optional input does not
+fail the step, and adding or changing one makes the step run again.
+
+A step calls function(*args, **kwargs) from its script, or runs the whole
+script as __main__ when it names no function. A step depends on the steps
+whose outputs it reads, and steps that do not depend on each other run in
+parallel, each in its own process.
+
+A step is skipped when its outputs exist and are unchanged and nothing it
+depends on changed since it last ran: its script and the modules of this
+directory the script imports, its parameters, the contents of its inputs
+and the draft setting (RENDER_DRAFT). The hashes are kept in a state file
+next to the manifest. As a step that reruns with the same result leaves
+its outputs' contents as they were, the steps after it are skipped too.
+
+Usage:
+
+    python run_manifest.py                  # bring everything up to date
+    python run_manifest.py overlay          # one step and what it needs
+    python run_manifest.py -j 2 --dry-run   # list what would run
+    python run_manifest.py --force music    # rerun a step even if up to date
+    python run_manifest.py -m other.json    # another manifest
+"""
+import argparse
+import ast
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import span
+from render_cache import content_key, file_digest
+from scripts import load_script
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MANIFEST = os.path.join(HERE, 'manifest.json')
+STATE_SUFFIX = '.state.json'
+
+# Environment variables that change what the steps write
+ENV_KEYS = ('RENDER_DRAFT',)
+
+
+class ManifestError(Exception):
+    """The manifest is inconsistent: unknown steps, cycles, clashing outputs."""
+
+
+def load_manifest(path):
+    with open(path) as f:
+        steps = json.load(f)['steps']
+    for name, step in steps.items():
+        step.setdefault('inputs', [])
+        step.setdefault('optional_inputs', [])
+        step.setdefault('outputs', [])
+        step.setdefault('args', [])
+        step.setdefault('kwargs', {})
+    return steps
+
+
+def dependencies(steps):
+    """Map each step to the steps producing its inputs."""
+    producers = {}
+    for name, step in steps.items():
+        for output in step['outputs']:
+            if output in producers:
+                raise ManifestError(f"{output} is written by both {producers[output]} and {name}")
+            producers[output] = name
+    return {name: {producers[path] for path in step['inputs'] + step['optional_inputs']
+                   if path in producers}
+            for name, step in steps.items()}
+
+
+def topological_order(deps):
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ManifestError("dependency cycle: " + ' -> '.join(path + [name]))
+        state[name] = 'visiting'
+        for dep in sorted(deps[name]):
+            visit(dep, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in sorted(deps):
+        visit(name, [])
+    return order
+
+
+def source_files(script, directory):
+    """The script and the modules of directory it imports, recursively."""
+    seen, pending = set(), [os.path.join(directory, script)]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for module in names:
+                candidate = os.path.join(directory, module.split('.')[0] + '.py')
+                if os.path.exists(candidate):
+                    pending.append(candidate)
+    return sorted(seen)
+
+
+def step_key(step, directory):
+    """Hash of everything the step's outputs are made from."""
+    params = json.dumps({field: step.get(field) for field in
+                         ('script', 'function', 'args', 'kwargs', 'inputs',
+                          'optional_inputs', 'outputs')},
+                        sort_keys=True)
+    parts = [params]
+    for path in source_files(step['script'], directory):
+        parts.append(f"{os.path.relpath(path, directory)}:{file_digest(path)}")
+    for path in step['inputs']:
+        parts.append(f"{path}:{file_digest(os.path.join(directory, path))}")
+    for path in step['optional_inputs']:
+        full_path = os.path.join(directory, path)
+        digest = file_digest(full_path) if os.path.exists(full_path) else 'missing'
+        parts.append(f"{path}:{digest}")
+    for name in ENV_KEYS:
+        parts.append(f"{name}={os.environ.get(name, '')}")
+    return content_key(*parts)
+
+
+def output_digests(step, directory):
+    """Digest of every output, or None if one is missing."""
+    digests = {}
+    for path in step['outputs']:
+        full_path = os.path.join(directory, path)
+        if not os.path.exists(full_path):
+            return None
+        digests[path] = file_digest(full_path)
+    return digests
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def up_to_date(step, directory, record, key):
+    return (record is not None and record['key'] == key
+            and output_digests(step, directory) == record['outputs'])
+
+
+def run_step(manifest_path, name):
+    """Run one step in this process (the body of each step's subprocess)."""
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    step = load_manifest(manifest_path)[name]
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    script = os.path.join(directory, step['script'])
+    if 'function' not in step:
+        runpy.run_path(script, run_name='__main__')
+        return
+    module = load_script(step['script'], directory)
+    getattr(module, step['function'])(*step['args'], **step['kwargs'])
+
+
+def _spawn(manifest_path, name, directory):
+    return subprocess.run([sys.executable, os.path.abspath(__file__),
+                           '--manifest', manifest_path, '--run-step', name],
+                          cwd=directory, capture_output=True, text=True)
+
+
+def build(manifest_path=DEFAULT_MANIFEST, targets=None, jobs=None, force=(),
+          dry_run=False, verbose=False):
+    """Bring the targets (all steps by default) up to date.
+
+    Returns {step: 'skipped' | 'ran' | 'failed' | 'blocked'}, where a
+    blocked step was not run because a step it depends on failed.
+    """
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    steps = load_manifest(manifest_path)
+    deps = dependencies(steps)
+    order = topological_order(deps)
+    unknown = set(targets or ()) - set(steps)
+    if unknown:
+        raise ManifestError(f"unknown steps: {', '.join(sorted(unknown))}")
+
+    # The targets and every step they need
+    wanted = set()
+    pending = list(targets or steps)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(deps[name])
+    order = [name for name in order if name in wanted]
+
+    state_path = os.path.splitext(manifest_path)[0] + STATE_SUFFIX
+    state = load_state(state_path)
+    results = {}
+    forced = set(force)
+
+    if dry_run:
+        # Without running anything, a step runs if it is out of date now or
+        # follows a step that runs
+        for name in order:
+            step = steps[name]
+            upstream = any(results[dep] == 'ran' for dep in deps[name])
+            inputs_exist = all(os.path.exists(os.path.join(directory, path))
+                               for path in step['inputs'])
+            stale = (name in forced or upstream or not inputs_exist or not up_to_date(
+                step, directory, state.get(name), step_key(step, directory)))
+            results[name] = 'ran' if stale else 'skipped'
+            print(f"{'run ' if stale else 'skip'} {name}")
+        return results
+
+    running = {}
+    keys = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        while len(results) < len(order):
+            for name in order:
+                if name in results or name in running.values():
+                    continue
+                stopped = sorted(dep for dep in deps[name]
+                                 if results.get(dep) in ('failed', 'blocked'))
+                if stopped:
+                    results[name] = 'blocked'
+                    print(f"blocked {name} (needs {', '.join(stopped)})")
+                    continue
+                if any(dep not in results for dep in deps[name]):
+                    continue
+                step = steps[name]
+                missing = [path for path in step['inputs']
+                           if not os.path.exists(os.path.join(directory, path))]
+                if missing:
+                    results[name] = 'failed'
+                    print(f"FAILED  {name} (missing inputs: {', '.join(missing)})")
+                    continue
+                keys[name] = step_key(step, directory)
+                if name not in forced and up_to_date(step, directory, state.get(name),
+                                                     keys[name]):
+                    results[name] = 'skipped'
+                    print(f"skipped {name}")
+                    continue
+                running[executor.submit(_timed_run, manifest_path, name, directory)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                process, elapsed = future.result()
+                step = steps[name]
+                digests = output_digests(step, directory)
+                if process.returncode != 0 or digests is None:
+                    results[name] = 'failed'
+                    state.pop(name, None)
+                    reason = (f"exit status {process.returncode}" if process.returncode
+                              else "missing outputs")
+                    print(f"FAILED  {name} ({reason}, {elapsed:.1f}s)")
+                    print(process.stdout + process.stderr, file=sys.stderr)
+                else:
+                    results[name] = 'ran'
+                    state[name] = {'key': keys[name], 'outputs': digests}
+                    print(f"ran     {name} ({elapsed:.1f}s)")
+                    if verbose:
+                        print(process.stdout + process.stderr)
+                save_state(state_path, state)
+    return results
+
+
+def _timed_run(manifest_path, name, directory):
+    start = time.perf_counter()
+    with span(name, category='step'):
+        process = _spawn(manifest_path, name, directory)
+    return process, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('steps', nargs='*', help="steps to bring up to date (default: all)")
+    parser.add_argument('-m', '--manifest', default=DEFAULT_MANIFEST)
+    parser.add_argument('-j', '--jobs', type=int, help="steps run at the same time")
+    parser.add_argument('--force', action='store_true',
+                        help="rerun the named steps (or all) even if up to date")
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="print the output of steps that succeed")
+    parser.add_argument('--run-step', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_step:
+        run_step(args.manifest, args.run_step)
+        return 0
+    force = ()
+    if args.force:
+        force = args.steps or load_manifest(args.manifest)
+    try:
+        results = build(args.manifest, args.steps or None, args.jobs, force,
+                        args.dry_run, args.verbose)
+    except ManifestError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 1 if any(result in ('failed', 'blocked') for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Import the numbered scripts, whose file names are not identifiers."""
+import importlib.util
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename, directory=HERE):
+    """Import a script from directory once per process and return the module."""
+    name = 'script_' + os.path.splitext(filename)[0].replace('-', '_').replace('.', '_')
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module  # pool workers unpickle functions by module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
@@ -0,0 +1,53 @@
+import numpy as np
+from moviepy.editor import ColorClip, VideoClip
+
+from compositing import ClipLayer, LayerStack, Overlay, StaticLayer, Timeline, is_static
+
+
+def test_timeline_accepts_non_uint8_frames():
+    # ColorClip frames are int64
+    red = ColorClip((32, 24), color=(255, 0, 0), duration=2)
+    blue = VideoClip(lambda t: np.full((24, 32, 3), [0.0, 0.0, 255.0]), duration=2)
+    clip = Timeline([red, blue], ['crossfade'], transition_duration=1).to_clip()
+    frame = clip.get_frame(1.5)
+    assert frame.dtype == np.uint8
+    assert tuple(frame[0, 0]) == (128, 0, 128)
+
+
+def test_overlay_accepts_non_uint8_frames():
+    background = ColorClip((32, 24), color=(0, 0, 200), duration=1)
+    overlay = ColorClip((16, 12), color=(200, 0, 0), duration=1)
+    frame = Overlay(background, overlay, 0.5).to_clip().get_frame(0.5)
+    assert tuple(frame[12, 16]) == (100, 0, 100)
+    assert tuple(frame[0, 0]) == (0, 0, 200)
+
+
+def test_timeline_letterboxes_clips_of_another_size():
+    wide = ColorClip((64, 36), color=(0, 255, 0), duration=1)
+    square = ColorClip((20, 20), color=(255, 255, 255), duration=1)
+    frame = Timeline([wide, square], [None]).to_clip().get_frame(1.5)
+    assert frame.shape == (36, 64, 3)
+    # Scaled to 36x36 in the middle, black bars left and right
+    assert tuple(frame[18, 32]) == (255, 255, 255)
+    assert tuple(frame[18, 5]) == (0, 0, 0)
+    assert tuple(frame[18, 58]) == (0, 0, 0)
+    assert (frame[:, 14:50] == 255).all()
+
+
+def test_layer_stack_caches_still_clips_and_redraws_moving_ones():
+    still = ColorClip((8, 8), color=(255, 0, 0), duration=2).set_position((0, 0))
+    moving = ColorClip((8, 8), color=(0, 255, 0), duration=2).set_position(
+        lambda t: (int(10 * t), 10))
+    faded = ColorClip((8, 8), color=(0, 0, 255), duration=2).crossfadein(1)
+    assert is_static(still)
+    assert not is_static(moving) and not is_static(faded)
+
+    stack = LayerStack([still, moving], size=(32, 24))
+    assert [type(layer) for layer in stack.layers] == [StaticLayer, ClipLayer]
+    clip = stack.to_clip(2)
+    first = clip.get_frame(0).copy()
+    later = clip.get_frame(1).copy()
+    assert tuple(first[0, 0]) == tuple(later[0, 0]) == (255, 0, 0)
+    assert tuple(first[10, 0]) == (0, 255, 0)
+    assert tuple(later[10, 0]) == (0, 0, 0)
+    assert tuple(later[10, 10]) == (0, 255, 0)
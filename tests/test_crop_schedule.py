@@ -0,0 +1,34 @@
+import numpy as np
+from moviepy.editor import ImageClip
+
+from scripts import load_script
+
+animation = load_script('4.1-extended-animatio.py')
+
+
+def picture(w=64, h=48):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+def transformed(img, transform):
+    # An ImageClip whose frames are transformed while .img stays the
+    # untransformed still, as after a make_frame wrapper
+    clip = ImageClip(img).set_fps(24).set_duration(1)
+    make_frame = clip.make_frame
+    clip = clip.copy()
+    clip.make_frame = lambda t: transform(make_frame(t))
+    return clip
+
+
+def test_zoom_keeps_earlier_transforms_of_an_image_clip():
+    img = picture()
+    frame = animation.Zoom(transformed(img, lambda f: f[:, ::-1])).get_frame(0)
+    # No zoom yet at t=0: the frame is the mirrored picture
+    assert np.array_equal(frame, img[:, ::-1])
+
+
+def test_crop_windows_fit_the_transformed_frame():
+    img = picture()
+    frame = animation.Pan(transformed(img, lambda f: f[:24, :32])).get_frame(0.5)
+    assert frame.shape == (24, 32, 3)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_pipeline import Adjustments, ImagePipeline
+
+ENHANCEMENTS = Adjustments().brightness(1.5).contrast(1.2)
+
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    return Image.fromarray(np.concatenate(
+        np.broadcast_arrays(x, y, (x + y) / 2), axis=2).astype(np.uint8))
+
+
+@pytest.mark.parametrize('source_size, size', [((40, 30), (160, 120)),
+                                               ((320, 240), (80, 60))])
+def test_adjust_resize_adjusts_the_smaller_image(monkeypatch, tmp_path,
+                                                 source_size, size):
+    adjusted = []
+    apply = Adjustments.apply
+    monkeypatch.setattr(Adjustments, 'apply',
+                        lambda self, img: adjusted.append(img.size) or apply(self, img))
+    pipeline = ImagePipeline()
+    pipeline.source.adjust_resize(ENHANCEMENTS, size).save('{stem}.png')
+    img = gradient(*source_size)
+    [path] = pipeline.run_image(img, 'out', str(tmp_path))
+    assert adjusted == [min(source_size, size, key=lambda s: s[0] * s[1])]
+
+    with Image.open(path) as result:
+        assert result.size == size
+        expected = apply(ENHANCEMENTS, img).resize(size)
+        difference = np.abs(np.asarray(result, float) - np.asarray(expected, float))
+        assert difference.mean() < 2
+
+
+@pytest.mark.parametrize('gamma', [0, -1.5])
+def test_gamma_must_be_positive(gamma):
+    with pytest.raises(ValueError):
+        Adjustments().gamma(gamma)
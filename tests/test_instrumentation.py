@@ -0,0 +1,63 @@
+import multiprocessing
+
+import pytest
+from moviepy.editor import ColorClip
+
+import instrumentation
+from instrumentation import count, span
+from video_tools import write_videofile
+
+pytestmark = pytest.mark.skipif(
+    'fork' not in multiprocessing.get_all_start_methods(),
+    reason="worker records are collected from forked processes")
+
+
+@pytest.fixture
+def recording():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def _task(n):
+    with span('task'):
+        count('items', n)
+    return n
+
+
+def test_worker_records_reach_the_parent(recording):
+    with span('parent'):
+        pass
+    pool = multiprocessing.get_context('fork').Pool(3)
+    try:
+        assert sum(pool.map(_task, range(10), chunksize=1)) == 45
+    finally:
+        pool.close()
+        pool.join()
+    report = instrumentation.summary()
+    # The parent's span is not copied into the workers' records
+    assert report['spans']['parent']['calls'] == 1
+    assert report['spans']['task']['calls'] == 10
+    assert report['counters']['items'] == 45
+
+
+def test_parallel_write_times_frames_and_encoding(recording, tmp_path):
+    clip = ColorClip((64, 48), color=(20, 20, 200), duration=1).set_fps(24)
+    write_videofile(clip, str(tmp_path / 'out.mp4'), logger=None, workers=2)
+    spans = instrumentation.summary()['spans']
+    assert spans['render_segment']['calls'] == 2
+    assert spans['video.make_frame']['calls'] >= 24
+    assert spans['video.encode_frame']['calls'] == 24
+
+
+def test_moviepy_writers_are_only_wrapped_while_writing(recording, tmp_path):
+    import moviepy.audio.AudioClip
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+    originals = (FFMPEG_VideoWriter.write_frame, moviepy.audio.AudioClip.ffmpeg_audiowrite)
+    clip = ColorClip((64, 48), color=(20, 200, 20), duration=0.5).set_fps(24)
+    write_videofile(clip, str(tmp_path / 'out.mp4'), logger=None, workers=1)
+    assert instrumentation.summary()['spans']['video.encode_frame']['calls'] == 12
+    assert (FFMPEG_VideoWriter.write_frame,
+            moviepy.audio.AudioClip.ffmpeg_audiowrite) == originals
@@ -0,0 +1,61 @@
+import subprocess
+from fractions import Fraction
+
+import numpy as np
+import pytest
+from moviepy.editor import AudioClip, ColorClip
+
+from scripts import load_script
+from video_tools import ffmpeg_binary, parse_rate, probe_duration, probe_streams
+
+FPS = 24
+
+
+def tone(duration, frequency=440):
+    return AudioClip(lambda t: np.sin(2*np.pi*frequency*np.array(t)).reshape(-1, 1).repeat(2, 1)
+                     if np.ndim(t) else [np.sin(2*np.pi*frequency*t)]*2, duration=duration)
+
+
+def video_pts(path):
+    """Presentation times of the video packets, in file order."""
+    out = subprocess.run([ffmpeg_binary(), '-hide_banner', '-i', path, '-map', '0:v:0',
+                          '-c', 'copy', '-f', 'framecrc', '-'],
+                         capture_output=True, text=True, check=True).stdout
+    lines = out.splitlines()
+    time_base = Fraction(next(line for line in lines if line.startswith('#tb 0:')).split(':')[1])
+    return [int(line.split(',')[2]) * time_base for line in lines if not line.startswith('#')]
+
+
+def write_clip(path, size, duration=2):
+    clip = ColorClip(size, color=(200, 30, 30), duration=duration).set_fps(FPS)
+    clip.set_audio(tone(duration)).write_videofile(str(path), logger=None)
+    return str(path)
+
+
+@pytest.fixture
+def animation():
+    return load_script('4.1-extended-animatio.py')
+
+
+def test_join_keeps_frames_evenly_spaced(tmp_path, animation):
+    clip = write_clip(tmp_path / 'a.mp4', (64, 48))
+    odd = write_clip(tmp_path / 'b.mp4', (80, 60))  # conformed before joining
+    output = str(tmp_path / 'joined.mp4')
+    animation.join_videos([clip, odd, clip], output)
+
+    pts = sorted(video_pts(output))
+    assert len(pts) == 3 * 2 * FPS
+    steps = np.diff(np.array(pts, dtype=float))
+    assert steps == pytest.approx(1 / FPS, abs=1e-3)
+    assert probe_duration(output) == pytest.approx(6, abs=1.5 / FPS)
+    assert parse_rate(probe_streams(output).fps) == FPS
+
+
+def test_join_decodes_without_timestamp_errors(tmp_path, animation):
+    clip = write_clip(tmp_path / 'a.mp4', (64, 48))
+    output = str(tmp_path / 'joined.mp4')
+    animation.join_videos([clip, clip], output)
+    stderr = subprocess.run([ffmpeg_binary(), '-hide_banner', '-v', 'warning', '-i', output,
+                             '-f', 'null', '-'], capture_output=True, text=True).stderr
+    assert 'non monotonically increasing' not in stderr
+
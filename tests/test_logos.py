@@ -0,0 +1,49 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from render_cache import ContentCache
+from scripts import load_script
+
+
+@pytest.fixture
+def logos(monkeypatch):
+    module = load_script('5-logos.py')
+    calls = []
+
+    def rasterize(svg):
+        # Stands in for cairosvg, which needs the Cairo library
+        calls.append(svg)
+        buffer = io.BytesIO()
+        Image.new('RGBA', (20, 20), (33, 150, 243, 255)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    monkeypatch.setattr(module, 'rasterize', rasterize)
+    module.calls = calls
+    module._logo_rgba.cache_clear()
+    return module
+
+
+def test_cached_png_rasterizes_once(tmp_path, logos):
+    cache = ContentCache(str(tmp_path))
+    svg = logos.logo_template.render(text='A')
+    assert logos.cached_png(cache, svg) == logos.cached_png(cache, svg)
+    assert len(logos.calls) == 1
+
+
+def test_evicted_png_is_rasterized_again(tmp_path, logos):
+    cache = ContentCache(str(tmp_path))
+    svg = logos.logo_template.render(text='B')
+    png = logos.cached_png(cache, svg)
+    for entry in os.listdir(tmp_path):
+        os.remove(tmp_path / entry)
+    assert logos.cached_png(cache, svg) == png
+    assert len(logos.calls) == 2
+
+
+def test_logo_rgba(tmp_path, logos):
+    rgba = logos.logo_rgba(str(tmp_path), text='C')
+    assert rgba.shape == (20, 20, 4)
+    assert not rgba.flags.writeable
@@ -0,0 +1,37 @@
+import asyncio
+import wave
+
+import numpy as np
+
+import music_player
+from music import SongStream
+from music_player import PreviewWavSink, RealtimePlayer
+
+
+def test_preview_wav_sink_renders_the_bars(tmp_path):
+    path = str(tmp_path / 'preview.wav')
+    stream = SongStream('happy', seed=0)
+    player = RealtimePlayer(stream, PreviewWavSink(path), realtime=False)
+    stats = asyncio.run(player.play(4))
+    assert stats.bars == 4
+    with wave.open(path) as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (2, 2, 44100)
+        seconds = f.getnframes() / f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), np.int16)
+    assert abs(seconds - 4 * music_player.BEATS_PER_BAR * 60 / stream.tempo) < 0.1
+    assert np.abs(samples).max() > 1000
+
+
+def test_no_busy_wait_after_the_last_bar(monkeypatch):
+    sleep = asyncio.sleep
+    zero_sleeps = []
+
+    async def counting_sleep(delay):
+        if delay <= 0:
+            zero_sleeps.append(delay)
+        await sleep(delay)
+    monkeypatch.setattr(music_player.asyncio, 'sleep', counting_sleep)
+    player = RealtimePlayer(SongStream('energetic', seed=0), lookahead=0.3)
+    stats = asyncio.run(player.play(1))
+    assert stats.bars == 1
+    assert len(zero_sleeps) < 20
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from music import PreviewSynth, compose_song
+
+
+def test_mix_matches_adding_note_by_note():
+    rng = np.random.default_rng(0)
+    wave = rng.uniform(-1, 1, 300).astype(np.float32)
+    # Overlapping, repeated and end-crossing onsets
+    starts = np.concatenate([rng.integers(0, 1000, 40), [0, 0, 950, 999]])
+    gains = rng.uniform(0, 1, len(starts)).astype(np.float32)
+    expected = np.zeros(1000, np.float32)
+    for start, gain in zip(starts, gains):
+        part = wave[:1000 - start]
+        expected[start:start + len(part)] += gain * part
+
+    synth = PreviewSynth()
+    synth.MIX_BLOCK = 1024  # several blocks per layer
+    mix = np.zeros(1000, np.float32)
+    synth._mix(mix, wave, starts, gains)
+    assert mix == pytest.approx(expected, abs=1e-5)
+
+
+def test_render_length():
+    audio = PreviewSynth().render(compose_song('sad', seed=3, duration_ms=3000), 3000)
+    assert len(audio.raw_data) == 3 * 44100 * 2 * 2
@@ -0,0 +1,37 @@
+import os
+
+from music import compose_song
+from render_cache import ContentCache
+
+
+def test_open_entry_survives_eviction(tmp_path):
+    cache = ContentCache(str(tmp_path))
+    path = cache.put('key', b'data', '.bin')
+    with cache.open('key', '.bin') as f:
+        os.remove(path)  # evicted by another process
+        assert f.read() == b'data'
+    assert cache.open('key', '.bin') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_put_keeps_an_entry_larger_than_the_cache(tmp_path):
+    cache = ContentCache(str(tmp_path), max_bytes=4)
+    cache.put('old', b'abc')
+    path = cache.put('new', b'0123456789')
+    assert os.path.exists(path)
+    assert cache.open('old') is None
+
+
+def test_evicted_hit_is_rendered_again(tmp_path):
+    cache = ContentCache(str(tmp_path / 'cache'))
+    composer = compose_song('happy', seed=0, duration_ms=2000)
+    filename = str(tmp_path / 'song')
+    path = composer.save_and_convert(filename, None, 2000, 'wav', cache, 'preview')
+    with open(path, 'rb') as f:
+        rendered = f.read()
+    for entry in os.listdir(cache.directory):
+        os.remove(os.path.join(cache.directory, entry))
+    os.remove(path)
+    assert composer.save_and_convert(filename, None, 2000, 'wav', cache, 'preview') == path
+    with open(path, 'rb') as f:
+        assert f.read() == rendered
@@ -0,0 +1,49 @@
+import json
+
+import run_manifest
+
+SCRIPT = '''
+import os
+
+source = 'extra.txt'
+with open('out.txt', 'w') as f:
+    f.write(open(source).read() if os.path.exists(source) else 'default')
+'''
+
+
+def write_manifest(directory, steps):
+    path = directory / 'manifest.json'
+    path.write_text(json.dumps({'steps': steps}))
+    return str(path)
+
+
+def test_optional_input_does_not_block_and_reruns_when_added(tmp_path):
+    (tmp_path / 'make.py').write_text(SCRIPT)
+    (tmp_path / 'copy.py').write_text(
+        "import shutil\nshutil.copy('out.txt', 'copy.txt')\n")
+    manifest = write_manifest(tmp_path, {
+        'make': {'script': 'make.py', 'optional_inputs': ['extra.txt'],
+                 'outputs': ['out.txt']},
+        'copy': {'script': 'copy.py', 'inputs': ['out.txt'], 'outputs': ['copy.txt']},
+    })
+    assert run_manifest.build(manifest) == {'make': 'ran', 'copy': 'ran'}
+    assert (tmp_path / 'copy.txt').read_text() == 'default'
+    assert run_manifest.build(manifest) == {'make': 'skipped', 'copy': 'skipped'}
+
+    (tmp_path / 'extra.txt').write_text('extra')
+    assert run_manifest.build(manifest) == {'make': 'ran', 'copy': 'ran'}
+    assert (tmp_path / 'copy.txt').read_text() == 'extra'
+
+
+def test_missing_input_blocks_dependents(tmp_path, capsys):
+    (tmp_path / 'make.py').write_text(SCRIPT)
+    (tmp_path / 'copy.py').write_text(
+        "import shutil\nshutil.copy('out.txt', 'copy.txt')\n")
+    manifest = write_manifest(tmp_path, {
+        'make': {'script': 'make.py', 'inputs': ['extra.txt'], 'outputs': ['out.txt']},
+        'copy': {'script': 'copy.py', 'inputs': ['out.txt'], 'outputs': ['copy.txt']},
+    })
+    assert run_manifest.build(manifest) == {'make': 'failed', 'copy': 'blocked'}
+    out = capsys.readouterr().out
+    assert 'missing inputs: extra.txt' in out
+    assert 'blocked copy (needs make)' in out
@@ -0,0 +1,29 @@
+import pytest
+
+import video
+from video_tools import probe_duration, probe_video_span, run_ffmpeg
+
+
+@pytest.fixture
+def video_with_long_audio(tmp_path):
+    # One second of video, one and a half of audio
+    path = str(tmp_path / 'long_audio.mp4')
+    run_ffmpeg(['-f', 'lavfi', '-i', 'color=c=red:s=64x48:r=24:d=1',
+                '-f', 'lavfi', '-i', 'sine=frequency=440:duration=1.5',
+                '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', path])
+    assert probe_duration(path) > 1.4
+    return path
+
+
+def test_add_soundtrack_matches_the_video_frames(monkeypatch, tmp_path,
+                                                 video_with_long_audio):
+    lengths = []
+    create_soundtrack = video.create_soundtrack
+    monkeypatch.setattr(video, 'create_soundtrack', lambda duration_ms, *args, **kwargs:
+                        lengths.append(duration_ms) or create_soundtrack(
+                            duration_ms, *args, **kwargs))
+    output = str(tmp_path / 'scored.mp4')
+    video.add_soundtrack(video_with_long_audio, output, seed=0, renderer='preview')
+    assert lengths == [1000]
+    assert probe_video_span(output) == pytest.approx((0, 1), abs=1e-3)
+    assert probe_duration(output) == pytest.approx(1, abs=0.05)
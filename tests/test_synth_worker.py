@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+import music
+from music import DRUM_CHANNEL, SongJob, SynthPool, SynthWorker, compose_song
+
+SOUNDFONT = os.environ.get('SOUNDFONT', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'FluidR3_GM.sf2'))
+
+needs_fluidsynth = pytest.mark.skipif(
+    music.fluidsynth is None or not os.path.exists(SOUNDFONT),
+    reason="needs pyfluidsynth, the FluidSynth library and a soundfont (set SOUNDFONT)")
+
+
+class RecordingSynth:
+    """Stands in for fluidsynth.Synth and records the programs selected."""
+
+    def __init__(self, samplerate):
+        self.programs = []
+
+    def sfload(self, path):
+        return 1
+
+    def system_reset(self):
+        self.programs.clear()
+
+    def program_select(self, channel, sfid, bank, program):
+        self.programs.append((channel, bank, program))
+
+    def noteon(self, channel, pitch, velocity):
+        pass
+
+    def noteoff(self, channel, pitch):
+        pass
+
+    def get_samples(self, n):
+        return np.zeros(2 * n, np.int16)
+
+
+def test_programs_go_to_melodic_channels_only(monkeypatch):
+    monkeypatch.setattr(music, 'fluidsynth', type('fluidsynth', (), {'Synth': RecordingSynth}))
+    composer = compose_song('happy', seed=0, duration_ms=4000)
+    composer.programs[DRUM_CHANNEL] = 0  # must not replace the drum kit
+    worker = SynthWorker('unused.sf2')
+    audio = worker.render(composer, 4000)
+    assert len(audio) == 4000
+    selected = {channel: program for channel, _, program in worker.synth.programs}
+    expected = dict(composer.programs)
+    del expected[DRUM_CHANNEL]
+    assert selected == expected
+
+
+@needs_fluidsynth
+def test_synth_worker_renders_the_song():
+    audio = SynthWorker(SOUNDFONT).render(compose_song('sad', seed=1, duration_ms=3000), 3000)
+    assert len(audio) == 3000
+    assert audio.channels == 2 and audio.sample_width == 2
+    assert audio.max > 0
+
+
+@needs_fluidsynth
+def test_synth_pool_renders_every_job(tmp_path):
+    jobs = [SongJob(mood, seed, str(tmp_path / f'{mood}_{seed}'), 2000, 'wav')
+            for seed, mood in enumerate(['happy', 'sad', 'energetic'])]
+    with SynthPool(SOUNDFONT, workers=2) as pool:
+        results = sorted(pool.render(jobs))
+    assert results == sorted((job.filename + '.wav', False) for job in jobs)
+    assert all(os.path.getsize(path) > 44 for path, _ in results)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from moviepy.editor import AudioClip, ColorClip
+
+import video_tools
+from video_tools import probe_duration, probe_streams, write_videofile
+
+pytestmark = pytest.mark.skipif(
+    'fork' not in video_tools.multiprocessing.get_all_start_methods(),
+    reason="parallel writes need the fork start method")
+
+
+def tone(duration, frequency=440):
+    return AudioClip(lambda t: np.sin(2*np.pi*frequency*np.array(t)).reshape(-1, 1).repeat(2, 1)
+                     if np.ndim(t) else [np.sin(2*np.pi*frequency*t)]*2, duration=duration)
+
+
+def test_parallel_write_accepts_logger_and_threads(tmp_path):
+    clip = ColorClip((64, 48), color=(200, 30, 30), duration=2).set_fps(24)
+    output = str(tmp_path / 'par.mp4')
+    write_videofile(clip, output, fps=24, logger=None, threads=2, workers=3)
+    assert probe_duration(output) == pytest.approx(2, abs=0.05)
+
+
+def test_parallel_write_uses_the_serial_audio_codec(tmp_path):
+    clip = ColorClip((64, 48), color=(30, 200, 30), duration=1).set_fps(24)
+    clip = clip.set_audio(tone(1))
+    serial, parallel = str(tmp_path / 'serial.mp4'), str(tmp_path / 'parallel.mp4')
+    write_videofile(clip, serial, logger=None, workers=1)
+    write_videofile(clip, parallel, logger=None, workers=2)
+    assert probe_streams(parallel).audio_codec == probe_streams(serial).audio_codec == 'mp3'
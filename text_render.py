@@ -0,0 +1,52 @@
+"""In-process text rendering with Pillow, used instead of ImageMagick."""
+from functools import lru_cache
+
+import numpy as np
+from moviepy.video.VideoClip import ImageClip
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_FONT = "arial.ttf"
+
+# Scratch surface for measuring text
+_measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+
+
+@lru_cache(maxsize=32)
+def load_font(font=DEFAULT_FONT, size=24):
+    """Load a TrueType font once per (font, size), like 1.1-morpil.py."""
+    try:
+        return ImageFont.truetype(font, size)
+    except IOError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1 only has a fixed-size default
+            return ImageFont.load_default()
+
+
+@lru_cache(maxsize=256)
+def render_text(text, font=DEFAULT_FONT, fontsize=70, color='white',
+                stroke_width=0, stroke_color=None):
+    """Render text as a read-only RGBA array cropped to its bounding box.
+
+    Layers are cached on all arguments, so repeated titles are rasterized
+    only once.
+    """
+    face = load_font(font, fontsize)
+    left, top, right, bottom = _measure.textbbox(
+        (0, 0), text, font=face, stroke_width=stroke_width)
+    img = Image.new('RGBA', (max(right - left, 1), max(bottom - top, 1)),
+                    (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.text((-left, -top), text, font=face, fill=color,
+              stroke_width=stroke_width, stroke_fill=stroke_color)
+    layer = np.array(img)
+    layer.flags.writeable = False
+    return layer
+
+
+def text_clip(text, fontsize=70, color='white', font=DEFAULT_FONT,
+              stroke_width=0, stroke_color=None):
+    """ImageClip with a transparent background, a stand-in for TextClip."""
+    return ImageClip(render_text(text, font, fontsize, color,
+                                 stroke_width, stroke_color),
+                     transparent=True)
@@ -1,3 +1,26 @@
-from music import create_multi_track_song 
+import os
+import tempfile
 
-create_multi_track_song(mood="happy")
\ No newline at end of file
+from music import create_multi_track_song, create_soundtrack
+from video_tools import mux_audio, probe_video_span
+
+
+def add_soundtrack(video_path, output_path, mood="happy", seed=None,
+                   soundfont_path="FluidR3_GM.sf2", renderer="fluidsynth"):
+    """Score a video with generated music of exactly its length.
+
+    The length is that of the video frames, not of an audio track that
+    may run past them. The music is rendered to WAV and muxed in; the
+    video stream is copied without re-encoding.
+    """
+    start, end = probe_video_span(video_path)
+    duration_ms = int(round((end - start) * 1000))
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = create_soundtrack(duration_ms, os.path.join(tmp, 'soundtrack'),
+                                       mood, soundfont_path, seed, renderer=renderer)
+        mux_audio(video_path, audio_path, output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    create_multi_track_song(mood="happy")
\ No newline at end of file
@@ -0,0 +1,376 @@
+"""Rendering helpers shared by the video scripts."""
+import contextlib
+import gc
+import multiprocessing
+import os
+import re
+import subprocess
+import tempfile
+from collections import namedtuple
+from fractions import Fraction
+
+import moviepy.audio.AudioClip
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.tools import find_extension
+from moviepy.video.VideoClip import ImageClip
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from PIL import Image
+
+from instrumentation import count, count_file, enabled, span, traced
+
+# Number of processes used by write_videofile. Set RENDER_WORKERS (for
+# example to the number of cores) to render long videos in parallel chunks.
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '1'))
+
+# Draft renders. Set RENDER_DRAFT to a scale factor below 1 (for example
+# 0.25) to check timing and layout quickly: sources are decoded smaller,
+# frame and text sizes shrink by the factor, videos are written at no more
+# than DRAFT_FPS frames per second with the fastest x264 preset. Unset, the
+# same calls render at full quality.
+DRAFT_SCALE = float(os.environ.get('RENDER_DRAFT') or 1)
+DRAFT_FPS = 12
+DRAFT_PRESET = 'ultrafast'
+# Written into the metadata of draft outputs, which are not scaled again
+# when a later step loads them
+DRAFT_TAG = 'render-draft'
+
+# Keyword arguments of VideoClip.write_videofile that only concern audio;
+# in parallel mode the audio track is written once, separately.
+AUDIO_KWARGS = ('audio', 'audio_fps', 'audio_nbytes', 'audio_codec',
+                'audio_bitrate', 'audio_bufsize', 'temp_audiofile',
+                'remove_temp')
+
+# Clip being rendered by the worker processes (inherited through fork)
+_parallel_clip = None
+
+# Stream parameters that must be equal for two files to be joined by
+# stream copy. fps is ffmpeg's rate text (see parse_rate), time_base the
+# video stream's tbn. The audio fields are None for files without audio.
+StreamSignature = namedtuple('StreamSignature', [
+    'video_codec', 'profile', 'pix_fmt', 'width', 'height', 'fps',
+    'time_base', 'audio_codec', 'sample_rate', 'channels'])
+
+_VIDEO_STREAM = re.compile(
+    r"Stream #\d+:\d+.*?: Video: (\w+)((?: \([^)]*\))*), (\w+).*?, "
+    r"(\d+)x(\d+).*?, ([\d.]+(?:k)?) (?:fps|tbr)")
+_AUDIO_STREAM = re.compile(
+    r"Stream #\d+:\d+.*?: Audio: (\w+)(?: \([^)]*\))*, (\d+) Hz, ([^,]+)")
+_TIME_BASE = re.compile(r"([\d.]+k?) tbn")
+_DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+# Audio codecs each container can take by stream copy; None means any
+COPYABLE_AUDIO = {'.mp4': ('aac', 'mp3'), '.m4v': ('aac', 'mp3'),
+                  '.mov': ('aac', 'mp3'), '.mkv': None,
+                  '.webm': ('opus', 'vorbis')}
+
+
+def ffmpeg_binary():
+    return get_setting("FFMPEG_BINARY")
+
+
+def run_ffmpeg(args):
+    with span('ffmpeg', args=' '.join(map(str, args))):
+        subprocess.run([ffmpeg_binary(), '-y', '-loglevel', 'error'] + list(args),
+                       check=True)
+
+
+def _probe(path):
+    # ffmpeg prints the stream information of its input to stderr
+    return subprocess.run([ffmpeg_binary(), '-hide_banner', '-i', path],
+                          capture_output=True, text=True).stderr
+
+
+def probe_duration(path):
+    """Duration of a media file in seconds, as recorded in its container."""
+    duration = _DURATION.search(_probe(path))
+    if duration is None:
+        raise IOError(f"Could not read the duration of {path}")
+    hours, minutes, seconds = duration.groups()
+    return int(hours)*3600 + int(minutes)*60 + float(seconds)
+
+
+def parse_rate(rate):
+    """A frame rate or time base as ffmpeg prints it ('24', '29.97', '90k')."""
+    if rate.endswith('k'):
+        return Fraction(rate[:-1]) * 1000
+    return Fraction(rate)
+
+
+def probe_video_span(path):
+    """(start, end) in seconds of the first video stream's frames.
+
+    Unlike the container duration, this does not include audio that runs
+    past the last frame.
+    """
+    out = subprocess.run([ffmpeg_binary(), '-hide_banner', '-i', path,
+                          '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-'],
+                         capture_output=True, text=True).stdout
+    time_base = None
+    start = end = None
+    for line in out.splitlines():
+        if line.startswith('#tb 0:'):
+            time_base = Fraction(line.split(':', 1)[1].strip())
+        elif line and not line.startswith('#'):
+            _, _, pts, duration = (int(field) for field in line.split(',')[:4])
+            start = pts if start is None else min(start, pts)
+            end = pts + duration if end is None else max(end, pts + duration)
+    if time_base is None or start is None:
+        raise IOError(f"No video frames found in {path}")
+    return float(start * time_base), float(end * time_base)
+
+
+def probe_streams(path):
+    """Read the StreamSignature of the first video and audio stream."""
+    stderr = _probe(path)
+    video = _VIDEO_STREAM.search(stderr)
+    if video is None:
+        raise IOError(f"No video stream found in {path}")
+    codec, extras, pix_fmt, width, height, fps = video.groups()
+    profile = re.match(r" \(([^)]*)\)", extras)
+    line_end = stderr.find('\n', video.start())
+    time_base = _TIME_BASE.search(stderr, video.start(),
+                                  line_end if line_end >= 0 else len(stderr))
+    audio = _AUDIO_STREAM.search(stderr)
+    return StreamSignature(
+        codec, profile.group(1) if profile else None, pix_fmt,
+        int(width), int(height), fps, time_base.group(1) if time_base else None,
+        *(audio.groups() if audio else (None, None, None)))
+
+
+def drafting():
+    return DRAFT_SCALE < 1
+
+
+def draft_length(length):
+    """A length in pixels, such as a font size, scaled for draft renders."""
+    if not drafting():
+        return length
+    return max(1, int(round(length*DRAFT_SCALE)))
+
+
+def draft_size(size):
+    """A (width, height) frame size scaled for draft renders."""
+    if not drafting():
+        return tuple(size)
+    # Even sizes, as yuv420p needs
+    return tuple(max(2, int(round(n*DRAFT_SCALE/2))*2) for n in size)
+
+
+def _is_draft(path):
+    return re.search(r"comment\s*: " + DRAFT_TAG, _probe(path)) is not None
+
+
+def load_video(path, **kwargs):
+    """Open a VideoFileClip; in draft mode ffmpeg decodes it at draft size."""
+    if (drafting() and 'target_resolution' not in kwargs
+            and not _is_draft(path)):
+        signature = probe_streams(path)
+        width, height = draft_size((signature.width, signature.height))
+        kwargs['target_resolution'] = (height, width)
+    return VideoFileClip(path, **kwargs)
+
+
+def load_image(path, duration=None):
+    """ImageClip of an image file, shrunk to draft size in draft mode."""
+    if not drafting():
+        return ImageClip(path, duration=duration)
+    with Image.open(path) as img:
+        size = draft_size(img.size)
+        img.draft('RGB', size)  # JPEGs are decoded at a reduced scale
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        img = img.resize(size, Image.BILINEAR)
+    return ImageClip(np.asarray(img), duration=duration)
+
+
+def concat_by_copy(video_paths, output_path, audio_path=None, metadata=()):
+    """Join videos with identical stream parameters without re-encoding.
+
+    The concat demuxer starts each file where the previous one ended, and
+    audio running past the last frame (as in moviepy's mp3 tracks) would
+    push the next file's frames late. So every input is cut where its
+    video ends, and the output at the total length of the video.
+
+    metadata holds 'key=value' tags for the output; the inputs' own tags
+    are not carried over.
+    """
+    total = 0.0
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for path in video_paths:
+            start, end = probe_video_span(path)
+            total += end - start
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\noutpoint {end:.6f}\n")
+        list_path = f.name
+    try:
+        args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+        if audio_path:
+            args += ['-i', audio_path, '-map', '0:v', '-map', '1:a']
+        for tag in metadata:
+            args += ['-metadata', tag]
+        run_ffmpeg(args + ['-c', 'copy', '-t', f"{total:.6f}", output_path])
+    finally:
+        os.remove(list_path)
+
+
+def mux_audio(video_path, audio_path, output_path):
+    """Give a video a new audio track without re-encoding the video.
+
+    The video stream is copied as is and the output is cut to the length
+    of its frames (see probe_video_span). The audio is copied too when the output container takes its
+    codec; otherwise (a WAV file, say) only the audio is encoded.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    audio = _AUDIO_STREAM.search(_probe(audio_path))
+    copyable = COPYABLE_AUDIO.get(ext, ())
+    if audio and (copyable is None or audio.group(1) in copyable):
+        audio_codec = 'copy'
+    else:
+        audio_codec = 'libopus' if ext == '.webm' else 'aac'
+    start, end = probe_video_span(video_path)
+    run_ffmpeg(['-i', video_path, '-i', audio_path,
+                '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy',
+                '-c:a', audio_codec, '-t', f"{end - start:.6f}",
+                output_path])
+
+
+def segment_bounds(duration, fps, segments):
+    """Split [0, duration) into frame-aligned (start, end) time ranges."""
+    total_frames = int(np.ceil(duration*fps - 1e-6))
+    edges = np.linspace(0, total_frames, segments + 1).round().astype(int)
+    # End each range half a frame early so moviepy renders exactly the
+    # frames of the range despite float rounding
+    return [(a/fps, (b - 0.5)/fps) for a, b in zip(edges[:-1], edges[1:])
+            if b > a]
+
+
+def _detach_readers():
+    # A forked worker shares the parent's ffmpeg pipes; drop them so each
+    # reader starts its own decoder on the next frame request.
+    for obj in gc.get_objects():
+        if isinstance(obj, FFMPEG_VideoReader):
+            obj.proc = None
+
+
+def _render_segment(job):
+    start, end, path, write_kwargs = job
+    with span('render_segment', start=start, end=end):
+        _parallel_clip.subclip(start, end).write_videofile(
+            path, **dict(write_kwargs, audio=False, threads=1, logger=None))
+    return path
+
+
+@contextlib.contextmanager
+def _traced_writers():
+    """Time moviepy's writers while recording, for the duration of a write.
+
+    Piping each frame to ffmpeg (which blocks while the encoder catches
+    up) is timed apart from making the frame, and so is the mixing and
+    encoding of the audio track. The originals are put back afterwards.
+    """
+    if not enabled():
+        yield
+        return
+    write_frame = FFMPEG_VideoWriter.write_frame
+    audiowrite = moviepy.audio.AudioClip.ffmpeg_audiowrite
+    FFMPEG_VideoWriter.write_frame = traced('video.encode_frame', 'frame')(write_frame)
+    moviepy.audio.AudioClip.ffmpeg_audiowrite = traced('audio.mix_and_encode')(audiowrite)
+    try:
+        yield
+    finally:
+        FFMPEG_VideoWriter.write_frame = write_frame
+        moviepy.audio.AudioClip.ffmpeg_audiowrite = audiowrite
+
+
+def _traced_frames(clip):
+    """A copy of clip recording a 'video.make_frame' span per frame."""
+    get_frame = clip.get_frame
+
+    def make_frame(t):
+        with span('video.make_frame', 'frame'):
+            return get_frame(t)
+    traced_clip = clip.copy()
+    traced_clip.make_frame = make_frame
+    return traced_clip
+
+
+def _audio_codec(output_path, audio_codec=None):
+    """The audio encoder VideoClip.write_videofile uses for output_path."""
+    if audio_codec is None:
+        ext = os.path.splitext(output_path)[1].lower()
+        return 'libvorbis' if ext in ('.ogv', '.webm') else 'libmp3lame'
+    return {'raw16': 'pcm_s16le', 'raw32': 'pcm_s32le'}.get(audio_codec, audio_codec)
+
+
+def write_videofile(clip, output_path, workers=None, draft=None, **kwargs):
+    """Write a clip like VideoClip.write_videofile, optionally in parallel.
+
+    In draft mode (see RENDER_DRAFT) the frame rate is capped at DRAFT_FPS
+    and the fastest preset is used; pass draft=False for outputs whose
+    stream parameters must not change.
+
+    With more than one worker the timeline is cut into frame-aligned
+    segments that are rendered and encoded in separate processes and then
+    joined by stream copy. The audio track is encoded once on its own.
+    Parallel mode needs the fork start method, so on Windows the clip is
+    always written in a single process.
+    """
+    workers = RENDER_WORKERS if workers is None else workers
+    fps = kwargs.get('fps') or getattr(clip, 'fps', None)
+    if drafting() if draft is None else draft:
+        if fps:
+            fps = kwargs['fps'] = min(fps, DRAFT_FPS)
+        kwargs['preset'] = DRAFT_PRESET
+        kwargs['ffmpeg_params'] = list(kwargs.get('ffmpeg_params') or []) + [
+            '-metadata', f'comment={DRAFT_TAG}']
+    if enabled():
+        clip = _traced_frames(clip)
+    with _traced_writers(), span('write_videofile', path=output_path, workers=workers):
+        if (workers <= 1 or not fps
+                or 'fork' not in multiprocessing.get_all_start_methods()):
+            clip.write_videofile(output_path, **kwargs)
+        else:
+            _write_parallel(clip, output_path, workers, fps, kwargs)
+    if fps:
+        count('frames_written', int(np.ceil(clip.duration*fps - 1e-6)))
+    count_file('bytes_written', output_path)
+
+
+def _write_parallel(clip, output_path, workers, fps, kwargs):
+    global _parallel_clip
+    kwargs['fps'] = fps
+    audio_kwargs = {k: kwargs.pop(k) for k in AUDIO_KWARGS if k in kwargs}
+    with tempfile.TemporaryDirectory() as tmp:
+        audio = audio_kwargs.get('audio', True)
+        audio_path = audio if isinstance(audio, str) else None
+        if audio_path is None and audio and clip.audio is not None:
+            # Same encoder as a single-process write, so the output does
+            # not depend on the number of workers
+            codec = _audio_codec(output_path, audio_kwargs.get('audio_codec'))
+            audio_path = os.path.join(tmp, 'audio.' + find_extension(codec))
+            with span('write_audio'):
+                clip.audio.write_audiofile(
+                    audio_path, fps=audio_kwargs.get('audio_fps', 44100),
+                    nbytes=audio_kwargs.get('audio_nbytes', 2), codec=codec,
+                    bitrate=audio_kwargs.get('audio_bitrate'), logger=None)
+
+        ext = os.path.splitext(output_path)[1]
+        jobs = [(start, end, os.path.join(tmp, f'segment_{i:04d}{ext}'), kwargs)
+                for i, (start, end) in enumerate(
+                    segment_bounds(clip.duration, fps, workers))]
+        _parallel_clip = clip
+        pool = multiprocessing.get_context('fork').Pool(
+            workers, initializer=_detach_readers)
+        try:
+            with span('render_segments', segments=len(jobs)):
+                segment_paths = pool.map(_render_segment, jobs)
+        finally:
+            pool.close()
+            pool.join()
+            _parallel_clip = None
+        params = kwargs.get('ffmpeg_params') or []
+        metadata = [value for flag, value in zip(params, params[1:])
+                    if flag == '-metadata']
+        concat_by_copy(segment_paths, output_path, audio_path, metadata)